@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import os
 import subprocess
 import sys
 from lib2to3.main import main as lib2to3_main
@@ -16,6 +17,29 @@ CODE_PATHS = [
     'test',
 ]
 
+# these modules use the async syntax of Python 3.5+ and cannot be parsed by the linters running on Python 2
+PY35_ONLY_PATHS = [
+    os.path.join('timezonefinder', 'async_timezonefinder.py'),
+    os.path.join('test', 'async_lookups.py'),
+]
+
+
+def code_paths():
+    if sys.version_info >= (3, 5):
+        return CODE_PATHS
+    # all the python files except for the ones only running on Python 3.5+
+    paths = []
+    for code_path in CODE_PATHS:
+        if os.path.isfile(code_path):
+            paths.append(code_path)
+            continue
+        for directory, directory_names, file_names in os.walk(code_path):
+            for file_name in sorted(file_names):
+                path = os.path.join(directory, file_name)
+                if path.endswith('.py') and path not in PY35_ONLY_PATHS:
+                    paths.append(path)
+    return paths
+
 
 def main():
     try:
@@ -53,7 +77,7 @@ def run_flake8():
     print('Running flake8 code linting')
     try:
         original_argv = sys.argv
-        sys.argv = ['flake8'] + CODE_PATHS
+        sys.argv = ['flake8'] + code_paths()
         did_fail = False
         flake8_main()
     except SystemExit:
@@ -73,7 +97,7 @@ def run_2to3():
         '-f', 'set_literal',
         '-f', 'tuple_params',
         '-j', '4',
-    ] + CODE_PATHS)
+    ] + code_paths())
     print('2to3 failed' if ret else '2to3 passed')
     return ret
 
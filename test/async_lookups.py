@@ -0,0 +1,33 @@
+"""
+the coroutines of test_async.py (in a separate module, because the async syntax needs Python 3.5+)
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import asyncio
+
+
+async def lookups(test, async_timezone_finder):
+    # all the single point requests are running concurrently
+    results = await asyncio.gather(*[async_timezone_finder.timezone_at(*p) for p in test.points])
+    results_certain = await asyncio.gather(*[async_timezone_finder.certain_timezone_at(*p) for p in test.points])
+    assert list(results) == test.results
+    assert list(results_certain) == test.results_certain
+
+    lngs, lats = zip(*test.points)
+    assert list(await async_timezone_finder.timezone_at_many(lngs, lats)) == test.results
+    assert await async_timezone_finder.closest_timezone_at(*test.points[0]) == \
+        test.timezone_finder.closest_timezone_at(*test.points[0])
+
+    with test.assertRaises(ValueError):
+        await async_timezone_finder.timezone_at(181.0, 0.0)
+
+    # invalid requests must not make the batch of the valid ones fail
+    requests = [async_timezone_finder.timezone_at(*test.points[0]),
+                async_timezone_finder.timezone_at(float('nan'), 0.0),
+                async_timezone_finder.certain_timezone_at(0.0, float('inf')),
+                async_timezone_finder.timezone_at(*test.points[1])]
+    results = await asyncio.gather(*requests, return_exceptions=True)
+    assert results[0] == test.results[0]
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[2], ValueError)
+    assert results[3] == test.results[1]
@@ -0,0 +1,171 @@
+"""
+standalone benchmark of the lookup functions (no tzwhere needed)
+
+    python test/benchmark.py -n 1000 --seed 42 --numba both --output benchmark.json
+
+measures the latency per call (p50, p95, p99) of timezone_at(), certain_timezone_at() and closest_timezone_at()
+(with several search radii) and the throughput of the batch lookups for realistic points (within a timezone)
+and random points (anywhere, also on the sea). The points only depend on the seed,
+so the results of different versions can be compared to catch regressions.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+from timeit import default_timer
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark of the timezonefinder lookup functions')
+    parser.add_argument('-n', type=int, default=1000, help='the number of points per point set (default: 1000)')
+    parser.add_argument('--seed', type=int, default=42, help='the seed of the random points (default: 42)')
+    parser.add_argument('--numba', choices=['on', 'off', 'both'], default='both',
+                        help="run with numba, without numba (even when it is installed) or both (default)")
+    parser.add_argument('--radii', default='1,3',
+                        help="the search radii (delta_degree) of closest_timezone_at() to measure (default: '1,3')")
+    parser.add_argument('--output', help="the JSON file to write the results to. '-' for stdout")
+    return parser.parse_args(argv)
+
+
+def percentiles(latencies):
+    # latencies in microseconds
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(int(round(p / 100 * (len(latencies) - 1))), len(latencies) - 1)] * 10 ** 6
+
+    return {
+        'p50_us': percentile(50),
+        'p95_us': percentile(95),
+        'p99_us': percentile(99),
+        'mean_us': sum(latencies) / len(latencies) * 10 ** 6,
+        'calls_per_s': len(latencies) / sum(latencies),
+    }
+
+
+def measure_calls(function, points, **kwargs):
+    # warm up (e.g. loading the compiled numba functions from the cache)
+    for point in points[:10]:
+        function(*point, **kwargs)
+
+    latencies = []
+    for lng, lat in points:
+        start = default_timer()
+        function(lng, lat, **kwargs)
+        latencies.append(default_timer() - start)
+    return percentiles(latencies)
+
+
+def measure_batch(function, points):
+    lngs = [lng for lng, lat in points]
+    lats = [lat for lng, lat in points]
+    function(lngs[:10], lats[:10])
+    start = default_timer()
+    function(lngs, lats)
+    return {'points_per_s': len(points) / (default_timer() - start)}
+
+
+def create_point_sets(timezone_finder, n, seed):
+    generator = random.Random(seed)
+
+    def random_point():
+        return generator.uniform(-180, 180), generator.uniform(-90, 90)
+
+    random_points = [random_point() for i in range(n)]
+    # points within a timezone
+    realistic_points = []
+    # points on the sea (no timezone), closest_timezone_at() is only meant for those
+    sea_points = []
+    while len(realistic_points) < n or len(sea_points) < n:
+        point = random_point()
+        if timezone_finder.certain_timezone_at(*point) is None:
+            if len(sea_points) < n:
+                sea_points.append(point)
+        elif len(realistic_points) < n:
+            realistic_points.append(point)
+    return {'realistic': realistic_points, 'random': random_points}, sea_points
+
+
+def run(arguments):
+    if arguments.numba == 'off':
+        # makes 'import numba' fail, so the pure Python helpers are being used
+        sys.modules['numba'] = None
+
+    from timezonefinder import TimezoneFinder
+    from timezonefinder import __version__
+
+    start = default_timer()
+    timezone_finder = TimezoneFinder()
+    startup_time = default_timer() - start
+
+    point_sets, sea_points = create_point_sets(timezone_finder, arguments.n, arguments.seed)
+
+    results = {
+        'version': __version__,
+        'numba': timezone_finder.using_numba(),
+        'startup_s': startup_time,
+    }
+    for name, points in point_sets.items():
+        results['timezone_at_' + name] = measure_calls(timezone_finder.timezone_at, points)
+        results['certain_timezone_at_' + name] = measure_calls(timezone_finder.certain_timezone_at, points)
+        results['timezone_at_many_' + name] = measure_batch(timezone_finder.timezone_at_many, points)
+        results['certain_timezone_at_many_' + name] = measure_batch(timezone_finder.certain_timezone_at_many, points)
+
+    for radius in arguments.radii.split(','):
+        results['closest_timezone_at_sea_delta_' + radius] = measure_calls(timezone_finder.closest_timezone_at,
+                                                                           sea_points, delta_degree=int(radius))
+    return results
+
+
+def print_results(results):
+    print('\nnumba:', 'ON' if results['numba'] else 'OFF', ' startup: {:.3f}s'.format(results['startup_s']),
+          file=sys.stderr)
+    for name in sorted(results):
+        result = results[name]
+        if not isinstance(result, dict):
+            continue
+        if 'p50_us' in result:
+            print('{:45} p50 {:10.1f}us  p95 {:10.1f}us  p99 {:10.1f}us  {:10.0f} calls/s'.format(
+                name, result['p50_us'], result['p95_us'], result['p99_us'], result['calls_per_s']), file=sys.stderr)
+        elif 'points_per_s' in result:
+            print('{:45} {:10.0f} points/s'.format(name, result['points_per_s']), file=sys.stderr)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    if arguments.numba == 'both':
+        # numba can only be disabled before timezonefinder has been imported: one process per mode
+        runs = {}
+        for mode in ['on', 'off']:
+            output = subprocess.check_output([sys.executable, __file__, '-n', str(arguments.n),
+                                              '--seed', str(arguments.seed), '--radii', arguments.radii,
+                                              '--numba', mode, '--output', '-'])
+            runs.update(json.loads(output.decode('utf-8'))['runs'])
+    else:
+        results = run(arguments)
+        runs = {'numba' if results['numba'] else 'no_numba': results}
+
+    if arguments.output != '-':
+        for results in runs.values():
+            print_results(results)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'n': arguments.n,
+        'seed': arguments.seed,
+        'runs': runs,
+    }
+    if arguments.output == '-':
+        print(json.dumps(report, indent=2, sort_keys=True))
+    elif arguments.output is not None:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import random
+import sys
+import unittest
+
+import pytest
+
+from timezonefinder.timezonefinder import TimezoneFinder
+
+if sys.version_info < (3, 5):
+    pytest.skip('AsyncTimezoneFinder needs Python 3.5+', allow_module_level=True)
+
+import asyncio  # noqa: E402 isort:skip
+from concurrent.futures import ProcessPoolExecutor  # noqa: E402 isort:skip
+from multiprocessing import get_context  # noqa: E402 isort:skip
+
+from async_lookups import lookups  # noqa: E402 isort:skip
+from timezonefinder.async_timezonefinder import AsyncTimezoneFinder  # noqa: E402 isort:skip
+
+
+def random_point():
+    return random.uniform(-180, 180), random.uniform(-90, 90)
+
+
+class AsyncTest(unittest.TestCase):
+    timezone_finder = TimezoneFinder()
+    points = []
+    results = []
+    results_certain = []
+    for i in range(200):
+        point = random_point()
+        points.append(point)
+        results.append(timezone_finder.timezone_at(*point))
+        results_certain.append(timezone_finder.certain_timezone_at(*point))
+
+    def run_lookups(self, async_timezone_finder):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(lookups(self, async_timezone_finder))
+        finally:
+            loop.close()
+
+    def test_threads(self):
+        self.run_lookups(AsyncTimezoneFinder(self.timezone_finder, max_batch_size=64))
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'ProcessPoolExecutor(mp_context=...) needs Python 3.7+')
+    def test_processes(self):
+        # forked workers hang at exit when a parallel numba function has been launched before (s. process_pool)
+        executor = ProcessPoolExecutor(2, mp_context=get_context('spawn'))
+        try:
+            self.run_lookups(AsyncTimezoneFinder(self.timezone_finder, executor=executor))
+        finally:
+            executor.shutdown()
@@ -0,0 +1,76 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import csv
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from timezonefinder.__main__ import main
+from timezonefinder.timezonefinder import TimezoneFinder
+
+
+class CommandLineTest(unittest.TestCase):
+    timezone_finder = TimezoneFinder()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_tsv(self):
+        input_path = os.path.join(self.directory, 'points.tsv')
+        output_path = os.path.join(self.directory, 'timezones.tsv')
+        points = [(random.uniform(-180, 180), random.uniform(-90, 90)) for i in range(500)]
+        with open(input_path, 'w') as input_file:
+            input_file.write('name\tlat\tlng\n')
+            for i, (lng, lat) in enumerate(points):
+                input_file.write('point{}\t{}\t{}\n'.format(i, lat, lng))
+            input_file.write('invalid\tabc\t1.0\n')
+
+        main([input_path, '-o', output_path, '-d', '\\t', '--header', '--lng-column', '2', '--lat-column', '1',
+              '--chunk-size', '64', '--closest'])
+
+        with open(output_path) as output_file:
+            rows = list(csv.reader(output_file, delimiter=str('\t')))
+        assert rows[0] == ['name', 'lat', 'lng', 'timezone']
+        assert len(rows) == len(points) + 2
+        for (lng, lat), row in zip(points, rows[1:]):
+            result = self.timezone_finder.timezone_at(lng, lat)
+            if result is None:
+                result = self.timezone_finder.closest_timezone_at(lng, lat)
+            assert row[3] == ('' if result is None else result)
+        assert rows[-1] == ['invalid', 'abc', '1.0', '']
+
+    def test_invalid_rows(self):
+        input_path = os.path.join(self.directory, 'points.csv')
+        output_path = os.path.join(self.directory, 'timezones.csv')
+        with open(input_path, 'w') as input_file:
+            input_file.write('1.0,nan\nnan,1.0\ninf,0.0\n0.0,-inf\n181.0,0.0\n1.0\n')
+
+        for arguments in [[], ['--in-memory'], ['--certain', '--closest']]:
+            main([input_path, '-o', output_path] + arguments)
+            with open(output_path) as output_file:
+                rows = list(csv.reader(output_file))
+            assert len(rows) == 6
+            for row in rows:
+                assert row[-1] == ''
+
+    def test_several_files(self):
+        paths = [os.path.join(self.directory, 'points{}.csv'.format(i)) for i in range(2)]
+        output_path = os.path.join(self.directory, 'timezones.csv')
+        for i, path in enumerate(paths):
+            with open(path, 'w') as input_file:
+                input_file.write('lng,lat,name\n')
+                # a quoted field with a line break
+                input_file.write('{}.0,{}.0,"line\nbreak"\n'.format(i, i))
+
+        main(paths + ['-o', output_path, '--header'])
+
+        with open(output_path) as output_file:
+            rows = list(csv.reader(output_file))
+        assert rows == [['lng', 'lat', 'name', 'timezone'],
+                        ['0.0', '0.0', 'line\nbreak', self.timezone_finder.timezone_at(0.0, 0.0) or ''],
+                        ['1.0', '1.0', 'line\nbreak', self.timezone_finder.timezone_at(1.0, 1.0) or '']]
@@ -0,0 +1,417 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import pickle
+import random
+import shutil
+import struct
+import tempfile
+import threading
+import unittest
+from multiprocessing.pool import ThreadPool
+from os.path import join
+
+from numpy import arccos, arcsin, arctan2, array, clip, cos, cumsum, floor, minimum, radians, roll, sin, sqrt, where
+
+from timezonefinder import helpers
+from timezonefinder.cache import LRUCache
+from timezonefinder.timezone_names import timezone_names
+from timezonefinder.timezonefinder import (EARTH_RADIUS_KM, HEADER_SIZE, NO_UNIQUE_ID, TimezoneFinder, check_header,
+                                           zone_ids_of_points)
+
+# number of random points to compare in each test
+N = 1000
+
+
+def random_point():
+    return random.uniform(-180, 180), random.uniform(-90, 90)
+
+
+def haversine(lng1, lat1, lng2, lat2):
+    # great circle distance in radians (all coordinates in radians)
+    return 2 * arcsin(sqrt(minimum(1.0, sin((lat2 - lat1) / 2) ** 2 +
+                                   cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2)))
+
+
+def bearing(lng1, lat1, lng2, lat2):
+    return arctan2(sin(lng2 - lng1) * cos(lat2), cos(lat1) * sin(lat2) - sin(lat1) * cos(lat2) * cos(lng2 - lng1))
+
+
+def distance_to_polygon(lng, lat, coords):
+    """
+    independent reference for distance_to_polygon_vectors(): the shortest great circle distance (in radians)
+    between the point (in degree) and all edges of the polygon, computed with the cross track distance
+    """
+    lng = radians(lng)
+    lat = radians(lat)
+    lngs2 = radians(coords[0] / 10 ** 7)
+    lats2 = radians(coords[1] / 10 ** 7)
+    # the edges from the point i-1 to the point i
+    lngs1 = roll(lngs2, 1)
+    lats1 = roll(lats2, 1)
+
+    distances1 = haversine(lngs1, lats1, lng, lat)
+    distances2 = haversine(lngs2, lats2, lng, lat)
+    edge_lengths = haversine(lngs1, lats1, lngs2, lats2)
+    angles = bearing(lngs1, lats1, lng, lat) - bearing(lngs1, lats1, lngs2, lats2)
+    cross_track = arcsin(sin(distances1) * sin(angles))
+    along_track = arccos(minimum(1.0, cos(distances1) / cos(cross_track)))
+    # the closest point of the great circle of the edge lies within the edge
+    within = (cos(angles) > 0) & (along_track <= edge_lengths)
+    return where(within, abs(cross_track), minimum(distances1, distances2)).min()
+
+
+def write_regridded_bin(timezone_finder, path, nr_shortcuts_per_lng, nr_shortcuts_per_lat):
+    """
+    writes the polygons of the .bin of the timezone_finder with another shortcut grid to path.
+    the shortcuts of a polygon are all the shortcuts within its boundaries
+    (more than the exact shortcuts of file_converter, which does not change the results)
+    """
+    nr_of_columns = 360 * nr_shortcuts_per_lng
+    nr_of_rows = 180 * nr_shortcuts_per_lat
+    nr_of_shortcuts = nr_of_columns * nr_of_rows
+    # (lng_max, lng_min, lat_max, lat_min) of every polygon in degree
+    boundaries = timezone_finder.boundaries / 10 ** 7
+    columns = clip(floor((boundaries[:, :2] + 180) * nr_shortcuts_per_lng), 0, nr_of_columns - 1).astype(int)
+    rows = clip(floor((90 - boundaries[:, 2:]) * nr_shortcuts_per_lat), 0, nr_of_rows - 1).astype(int)
+
+    entries = [[] for shortcut_nr in range(nr_of_shortcuts)]
+    for polygon_nr in range(timezone_finder.nr_of_entries):
+        for x in range(columns[polygon_nr, 1], columns[polygon_nr, 0] + 1):
+            for y in range(rows[polygon_nr, 0], rows[polygon_nr, 1] + 1):
+                entries[nr_of_rows * x + y].append(polygon_nr)
+
+    counts = array([len(polygon_nrs) for polygon_nrs in entries])
+    # the polygon numbers of the shortcuts follow the counts (2), addresses (4) and unique ids (2)
+    addresses = timezone_finder.shortcuts_start + 8 * nr_of_shortcuts + 2 * (cumsum(counts) - counts)
+    addresses[counts == 0] = 0
+    unique_ids = []
+    for polygon_nrs in entries:
+        zones = set(timezone_finder.id_of(polygon_nr) for polygon_nr in polygon_nrs)
+        unique_ids.append(zones.pop() if len(zones) == 1 else NO_UNIQUE_ID)
+
+    with open(timezone_finder.path, 'rb') as binary_file:
+        # the polygon sections do not depend on the grid
+        polygon_data = binary_file.read()[HEADER_SIZE:timezone_finder.shortcuts_start]
+    with open(path, 'wb') as binary_file:
+        binary_file.write(struct.pack(b'!HIHH', timezone_finder.nr_of_entries, timezone_finder.shortcuts_start,
+                                      nr_shortcuts_per_lng, nr_shortcuts_per_lat))
+        binary_file.write(polygon_data)
+        binary_file.write(counts.astype('>u2').tobytes())
+        binary_file.write(addresses.astype('>u4').tobytes())
+        binary_file.write(array(unique_ids, dtype='>u2').tobytes())
+        binary_file.write(array([p for polygon_nrs in entries for p in polygon_nrs], dtype='>u2').tobytes())
+
+
+class ConsistencyTest(unittest.TestCase):
+    # the results of the default (seek and read) mode and of the single point queries
+    # serve as reference for all the other modes and functions
+
+    timezone_finder = TimezoneFinder()
+
+    points = []
+    results = []
+    results_certain = []
+    for i in range(N):
+        point = random_point()
+        points.append(point)
+        results.append(timezone_finder.timezone_at(*point))
+        results_certain.append(timezone_finder.certain_timezone_at(*point))
+
+    def check_equality(self, timezone_finder):
+        for p, result, result_certain in zip(self.points, self.results, self.results_certain):
+            assert timezone_finder.timezone_at(*p) == result
+            assert timezone_finder.certain_timezone_at(*p) == result_certain
+
+    def test_mmap(self):
+        self.check_equality(TimezoneFinder(use_mmap=True))
+
+    def test_in_memory(self):
+        timezone_finder = TimezoneFinder(in_memory=True)
+        self.check_equality(timezone_finder)
+        lngs, lats = array(self.points).T
+        assert list(timezone_finder.timezone_at_many(lngs, lats)) == self.results
+        assert list(timezone_finder.certain_timezone_at_many(lngs, lats, workers=2)) == self.results_certain
+
+    def test_zone_ids_of_points(self):
+        # invalid points passed to the compiled batch lookup directly must not read outside of the arrays
+        if zone_ids_of_points is None:
+            return
+        timezone_finder = TimezoneFinder(in_memory=True)
+        nan = float('nan')
+        lngs = array([1.0, nan, 200.0, -float('inf'), 1.0])
+        lats = array([nan, 1.0, 0.0, 0.0, -91.0])
+        for certain in [False, True]:
+            zone_ids = zone_ids_of_points(lngs, lats, certain, timezone_finder.nr_shortcuts_per_lng,
+                                          timezone_finder.nr_shortcuts_per_lat, timezone_finder.unique_ids,
+                                          timezone_finder.shortcut_offsets, timezone_finder.shortcut_entries,
+                                          timezone_finder.zone_ids, timezone_finder.boundaries,
+                                          timezone_finder.nr_of_values, timezone_finder.polygon_offsets,
+                                          timezone_finder.coordinates)
+            assert list(zone_ids) == [-1] * len(lngs)
+
+    def test_pickle(self):
+        for timezone_finder in [TimezoneFinder(), TimezoneFinder(use_mmap=True, polygon_cache_bytes=10 ** 6)]:
+            timezone_finder = pickle.loads(pickle.dumps(timezone_finder))
+            self.check_equality(timezone_finder)
+        assert timezone_finder.polygon_cache_info()['max_size'] == 10 ** 6
+
+    def test_polygon_cache(self):
+        timezone_finder = TimezoneFinder(polygon_cache_bytes=10 ** 6)
+        self.check_equality(timezone_finder)
+        self.check_equality(timezone_finder)
+        info = timezone_finder.polygon_cache_info()
+        assert info['size'] <= 10 ** 6
+        assert info['hits'] > 0
+
+    def test_result_cache(self):
+        timezone_finder = TimezoneFinder(result_cache_size=2 * N)
+        self.check_equality(timezone_finder)
+        self.check_equality(timezone_finder)
+        info = timezone_finder.result_cache_info()
+        # every point is being queried twice with both functions
+        assert info['misses'] == 2 * N
+        assert info['hits'] == 2 * N
+
+        for lng, lat in [(float('inf'), 0.0), (0.0, float('-inf')), (float('nan'), 0.0), (181.0, 0.0)]:
+            with self.assertRaises(ValueError):
+                timezone_finder.timezone_at(lng, lat)
+            with self.assertRaises(ValueError):
+                timezone_finder.certain_timezone_at(lng, lat)
+
+    def test_stats(self):
+        for timezone_finder in [TimezoneFinder(collect_stats=True), TimezoneFinder(in_memory=True, collect_stats=True)]:
+            self.check_equality(timezone_finder)
+            stats = timezone_finder.stats()
+            assert stats['queries']['timezone_at'] == N
+            assert stats['queries']['certain_timezone_at'] == N
+            counters = stats['counters']
+            assert counters['inside_polygon_calls'] <= counters['shortcut_candidates'] - counters['bbox_rejects']
+            # all the lookups which were not answered by the unique zone of their shortcut
+            assert stats['histograms']['shortcut_candidates']['count'] + counters['unique_zone_hits'] == 2 * N
+            # every point which is in a zone has been tested with at least one polygon
+            assert counters['inside_polygon_calls'] >= N - self.results_certain.count(None)
+            timezone_finder.reset_stats()
+            assert timezone_finder.stats()['queries'] == {}
+            assert timezone_finder.stats()['counters']['bytes_read'] == 0
+        assert TimezoneFinder().stats() is None
+
+    def test_slow_query_log(self):
+        logged = []
+        # every query is slower than 0 seconds
+        timezone_finder = TimezoneFinder(slow_query_threshold=0, slow_query_log_size=10,
+                                         slow_query_callback=logged.append)
+        self.check_equality(timezone_finder)
+        assert len(logged) == 2 * N
+        for p in self.points[:5]:
+            timezone_finder.closest_timezone_at(*p)
+        queries = timezone_finder.slow_queries()
+        assert len(queries) == 10
+        assert [query['function'] for query in queries[-5:]] == ['closest_timezone_at'] * 5
+        query = queries[0]
+        assert query['function'] == 'certain_timezone_at'
+        assert query['result'] == self.results_certain[-3]
+        polygon_nrs = list(timezone_finder.shortcuts_of(query['lng'], query['lat']))
+        assert [polygon_nr for polygon_nr, nr_of_vertices in query['polygons']] == polygon_nrs
+        for polygon_nr, nr_of_vertices in query['polygons']:
+            assert nr_of_vertices == timezone_finder.coords_of(polygon_nr).shape[1]
+        timezone_finder.clear_slow_queries()
+        assert timezone_finder.slow_queries() == []
+
+        timezone_finder = TimezoneFinder(slow_query_threshold=60)
+        self.check_equality(timezone_finder)
+        assert timezone_finder.slow_queries() == []
+
+    def test_header(self):
+        with open(self.timezone_finder.path, 'rb') as binary_file:
+            data = binary_file.read()
+        # the values of the header (s. TimezoneFinder.__init__())
+        assert check_header(len(data), *struct.unpack_from(b'!HIHH', data))
+        # a .bin of an older version (without the resolution of the shortcut grid in the header)
+        old_data = data[:6] + data[10:]
+        assert not check_header(len(old_data), *struct.unpack_from(b'!HIHH', old_data))
+        # a truncated .bin
+        assert not check_header(len(data) // 2, *struct.unpack_from(b'!HIHH', data))
+
+    def test_other_grid(self):
+        # a .bin with another resolution of the shortcut grid than the default one has to give the same results
+        directory = tempfile.mkdtemp()
+        path = join(directory, 'timezone_data.bin')
+
+        class RegriddedTimezoneFinder(TimezoneFinder):
+            def _open(self):
+                self.path = path
+                TimezoneFinder._open(self)
+
+        try:
+            write_regridded_bin(self.timezone_finder, path, nr_shortcuts_per_lng=2, nr_shortcuts_per_lat=1)
+            lngs, lats = array(self.points).T
+            for timezone_finder in [RegriddedTimezoneFinder(), RegriddedTimezoneFinder(in_memory=True)]:
+                assert (timezone_finder.nr_of_columns, timezone_finder.nr_of_rows) == (720, 180)
+                for p, result, result_certain in zip(self.points, self.results, self.results_certain):
+                    assert timezone_finder.certain_timezone_at(*p) == result_certain
+                    if result_certain is not None:
+                        # the results on the sea depend on the shortcuts
+                        assert timezone_finder.timezone_at(*p) == result
+                assert list(timezone_finder.certain_timezone_at_many(lngs, lats)) == self.results_certain
+                assert list(timezone_finder.certain_timezone_at_many(lngs, lats, workers=2)) == self.results_certain
+                for lng, lat in self.points[:3]:
+                    assert (timezone_finder.closest_timezone_at(lng, lat, delta_degree=None) ==
+                            self.timezone_finder.closest_timezone_at(lng, lat, delta_degree=None))
+                del timezone_finder
+        finally:
+            shutil.rmtree(directory)
+
+    def test_ids_of(self):
+        polygon_nrs = list(range(self.timezone_finder.nr_of_entries))
+        ids = self.timezone_finder.ids_of(polygon_nrs)
+        assert list(ids) == [self.timezone_finder.id_of(p) for p in polygon_nrs]
+        # the ids must not overflow (there are more than 127 zones)
+        assert ids.dtype.itemsize >= 2
+
+    def test_unique_ids(self):
+        # the precomputed unique zone id of a shortcut has to match the ids of its polygons
+        for i in range(N):
+            x = random.randint(0, self.timezone_finder.nr_of_columns - 1)
+            y = random.randint(0, self.timezone_finder.nr_of_rows - 1)
+            zones = set(self.timezone_finder.id_of(p) for p in self.timezone_finder.polygons_of_shortcut(x, y))
+            unique_id = self.timezone_finder.unique_id_of_shortcut(x, y)
+            if len(zones) == 1:
+                assert unique_id == zones.pop()
+            else:
+                assert unique_id == NO_UNIQUE_ID
+
+    def test_closest_exact(self):
+        # compare with the closest of all the polygons
+        timezone_finder = TimezoneFinder(vector_cache_bytes=10 ** 6)
+        for lng, lat in self.points[:3]:
+            closest = (4, None)
+            for polygon_nr in range(self.timezone_finder.nr_of_entries):
+                distance = distance_to_polygon(lng, lat, self.timezone_finder.coords_of(polygon_nr))
+                closest = min(closest, (distance, self.timezone_finder.id_of(polygon_nr)))
+
+            assert self.timezone_finder.closest_timezone_at(lng, lat, delta_degree=None) == timezone_names[closest[1]]
+            assert timezone_finder.closest_timezone_at(lng, lat, delta_degree=None) == timezone_names[closest[1]]
+        assert timezone_finder.vector_cache_info()['entries'] > 0
+
+    def test_closest_timezones(self):
+        # compare with the distances to all the polygons
+        for lng, lat in self.points[:3]:
+            zone_distances = {}
+            for polygon_nr in range(self.timezone_finder.nr_of_entries):
+                zone_id = self.timezone_finder.id_of(polygon_nr)
+                distance = distance_to_polygon(lng, lat, self.timezone_finder.coords_of(polygon_nr))
+                zone_distances[zone_id] = min(zone_distances.get(zone_id, 4), distance)
+            closest = sorted((distance * EARTH_RADIUS_KM, timezone_names[zone_id])
+                             for zone_id, distance in zone_distances.items())
+
+            results = self.timezone_finder.closest_timezones(lng, lat, k=3)
+            assert [name for name, distance in results] == [name for distance, name in closest[:3]]
+            for (name, distance), (expected_distance, expected_name) in zip(results, closest):
+                assert abs(distance - expected_distance) < 10 ** -6
+
+            # the cutoff lies between the second and the third closest zone
+            max_distance_km = (closest[1][0] + closest[2][0]) / 2
+            results = self.timezone_finder.closest_timezones(lng, lat, k=3, max_distance_km=max_distance_km)
+            assert [name for name, distance in results] == [name for distance, name in closest[:2]]
+            assert self.timezone_finder.closest_timezones(lng, lat, max_distance_km=closest[0][0] / 2) == []
+
+    def test_many(self):
+        lngs, lats = array(self.points).T
+        assert list(self.timezone_finder.timezone_at_many(lngs, lats)) == self.results
+        assert list(self.timezone_finder.certain_timezone_at_many(lngs, lats)) == self.results_certain
+        assert list(self.timezone_finder.timezone_at_many(lngs, lats, workers=4)) == self.results
+        assert list(self.timezone_finder.certain_timezone_at_many(lngs, lats, workers=3)) == self.results_certain
+        assert list(self.timezone_finder.timezone_at_many(lngs, lats, processes=2)) == self.results
+        assert list(self.timezone_finder.timezone_at_iter(iter(self.points), chunk_size=99)) == self.results
+        assert list(self.timezone_finder.certain_timezone_at_iter(self.points, chunk_size=1000)) == self.results_certain
+        # raised when being called, not only when the results are being consumed
+        with self.assertRaises(ValueError):
+            self.timezone_finder.timezone_at_iter(self.points, chunk_size=0)
+        with self.assertRaises(ValueError):
+            self.timezone_finder.certain_timezone_at_iter(self.points, chunk_size=-1)
+
+        nan = float('nan')
+        inf = float('inf')
+        for timezone_finder in [self.timezone_finder, TimezoneFinder(in_memory=True)]:
+            for lngs, lats in [([0.0, 181.0], [0.0, 0.0]), ([0.0, nan], [0.0, 0.0]), ([1.0], [nan]),
+                               ([inf], [0.0]), ([0.0], [-inf])]:
+                with self.assertRaises(ValueError):
+                    timezone_finder.timezone_at_many(lngs, lats)
+                with self.assertRaises(ValueError):
+                    timezone_finder.certain_timezone_at_many(lngs, lats)
+
+    def test_worker_threads_exit(self):
+        lngs, lats = array(self.points).T
+        nr_of_threads = threading.active_count()
+        for i in range(10):
+            self.timezone_finder.timezone_at_many(lngs, lats, workers=4)
+        assert threading.active_count() == nr_of_threads
+
+    def test_threads(self):
+        # all threads share the same instance
+        for timezone_finder in [TimezoneFinder(), TimezoneFinder(use_mmap=True)]:
+            pool = ThreadPool(8)
+            try:
+                assert pool.map(lambda p: timezone_finder.timezone_at(*p), self.points) == self.results
+                assert pool.map(lambda p: timezone_finder.certain_timezone_at(*p), self.points) == self.results_certain
+            finally:
+                pool.close()
+
+
+class HelpersTest(unittest.TestCase):
+    # the pure numpy versions of the point in polygon test (only used without numba)
+
+    def test_inside_polygon_vectorized(self):
+        timezone_finder = TimezoneFinder()
+        big_polygons = [polygon_nr for polygon_nr in range(timezone_finder.nr_of_entries)
+                        if timezone_finder.coords_of(polygon_nr).shape[1] > helpers.VECTORIZED_MIN_POINTS]
+        assert len(big_polygons) > 0
+
+        for polygon_nr in big_polygons[:20]:
+            coords = timezone_finder.coords_of(polygon_nr)
+            xmax, xmin, ymax, ymin = (int(value) for value in timezone_finder.boundaries_of(polygon_nr))
+            # the vertices, points on the edges and random points within the boundaries
+            points = list(zip(coords[0].tolist(), coords[1].tolist()))
+            for i in range(coords.shape[1]):
+                points.append(((int(coords[0][i - 1]) + int(coords[0][i])) // 2,
+                               (int(coords[1][i - 1]) + int(coords[1][i])) // 2))
+            for i in range(200):
+                points.append((random.randint(xmin, xmax), random.randint(ymin, ymax)))
+
+            # the reference: the loop over the edges with python ints (int32 values overflow in position_to_line())
+            min_points = helpers.VECTORIZED_MIN_POINTS
+            helpers.VECTORIZED_MIN_POINTS = coords.shape[1]
+            try:
+                expected = [helpers.inside_polygon(x, y, coords.tolist()) for x, y in points]
+            finally:
+                helpers.VECTORIZED_MIN_POINTS = min_points
+
+            assert [helpers.inside_polygon_vectorized(x, y, coords) for x, y in points] == expected
+            xs, ys = array(points, dtype='i4').T
+            # edge by edge (more points than edges)
+            assert list(helpers.inside_polygon_many(xs, ys, coords)) == expected
+            # point by point
+            assert list(helpers.inside_polygon_many(xs[:50], ys[:50], coords)) == expected[:50]
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(10, size_of=len)
+        cache.put(1, 'aaaa')
+        cache.put(2, 'bbbb')
+        # 1 is now the most recently used entry
+        assert cache.get(1) == 'aaaa'
+        cache.put(3, 'cccc')
+        assert cache.get(2) is None
+        assert cache.get(1) == 'aaaa'
+        assert cache.get(3) == 'cccc'
+        # too big to be cached at all
+        cache.put(4, 'd' * 11)
+        assert cache.get(4) is None
+        assert len(cache) == 2
+
+        info = cache.info()
+        assert info['size'] == 8
+        assert info['hits'] == 3
+        assert info['misses'] == 2
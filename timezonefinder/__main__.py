@@ -0,0 +1,130 @@
+"""
+tags the rows of CSV/TSV files (or stdin) with the timezone of their coordinates:
+
+    python -m timezonefinder points.csv --lng-column 2 --lat-column 3 --header > points_with_timezones.csv
+    cat points.tsv | python -m timezonefinder --delimiter '\\t' --closest --workers 4
+
+the rows are being processed in chunks of a fixed size (constant memory) and every chunk is being looked up
+with one batch lookup. the timezone name is being appended as last column (empty when there is no result).
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import csv
+import sys
+import time
+from itertools import islice
+
+from .timezonefinder import TimezoneFinder
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog='python -m timezonefinder',
+                                     description='appends the timezone of the coordinates to every row of CSV/TSV data')
+    parser.add_argument('files', nargs='*', help='the files to read (default: stdin)')
+    parser.add_argument('-o', '--output', help='the file to write to (default: stdout)')
+    parser.add_argument('-d', '--delimiter', default=',', help="the column delimiter (default: ','). '\\t' for TSV")
+    parser.add_argument('--lng-column', type=int, default=0, help='the index of the longitude column (default: 0)')
+    parser.add_argument('--lat-column', type=int, default=1, help='the index of the latitude column (default: 1)')
+    parser.add_argument('--header', action='store_true',
+                        help="the first row of every file is a header (a 'timezone' column is being appended)")
+    parser.add_argument('--chunk-size', type=int, default=10000, help='the number of rows per batch lookup')
+    parser.add_argument('--certain', action='store_true', help='use certain_timezone_at() instead of timezone_at()')
+    parser.add_argument('--closest', action='store_true',
+                        help='use closest_timezone_at() for the points without a result (slow)')
+    parser.add_argument('--delta-degree', type=int, default=1, help='the search radius of closest_timezone_at()')
+    parser.add_argument('--workers', type=int, default=1, help='the number of threads per batch lookup')
+    parser.add_argument('--in-memory', action='store_true', help='load all the data into memory at startup')
+    return parser.parse_args(argv)
+
+
+def open_csv(path, mode):
+    # the csv module needs binary files on Python 2 and files without newline translation on Python 3
+    if sys.version_info[0] < 3:
+        return open(path, mode + 'b')
+    return open(path, mode, newline='')
+
+
+def resolve_chunk(timezone_finder, rows, arguments):
+    """
+    :return: the number of points which could be parsed
+    """
+    # the rows whose coordinates can be parsed and lie within the bounds
+    valid_rows = []
+    lngs = []
+    lats = []
+    for row in rows:
+        try:
+            lng = float(row[arguments.lng_column])
+            lat = float(row[arguments.lat_column])
+        except (IndexError, ValueError):
+            row.append('')
+            continue
+        # NaN fails every comparison, so it is treated like an out of bounds value
+        if not (-180.0 <= lng <= 180.0 and -90.0 <= lat <= 90.0):
+            row.append('')
+            continue
+        valid_rows.append(row)
+        lngs.append(lng)
+        lats.append(lat)
+
+    if arguments.certain:
+        results = timezone_finder.certain_timezone_at_many(lngs, lats, workers=arguments.workers)
+    else:
+        results = timezone_finder.timezone_at_many(lngs, lats, workers=arguments.workers)
+
+    for row, lng, lat, result in zip(valid_rows, lngs, lats, results):
+        if result is None and arguments.closest:
+            result = timezone_finder.closest_timezone_at(lng, lat, delta_degree=arguments.delta_degree)
+        row.append('' if result is None else result)
+    return len(valid_rows)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    if arguments.delimiter == '\\t':
+        arguments.delimiter = '\t'
+    # the csv module of Python 2 only accepts byte strings as delimiter
+    delimiter = str(arguments.delimiter)
+
+    timezone_finder = TimezoneFinder(in_memory=arguments.in_memory)
+    output_file = sys.stdout if arguments.output is None else open_csv(arguments.output, 'w')
+    writer = csv.writer(output_file, delimiter=delimiter, lineterminator='\n')
+
+    start_time = time.time()
+    nr_of_points = 0
+    header_written = False
+    for path in arguments.files or ['-']:
+        input_file = sys.stdin if path == '-' else open_csv(path, 'r')
+        try:
+            reader = csv.reader(input_file, delimiter=delimiter)
+            if arguments.header:
+                header = next(reader, None)
+                # only the header of the first file is being written (the output is one file)
+                if header is not None and not header_written:
+                    writer.writerow(header + ['timezone'])
+                    header_written = True
+
+            while True:
+                rows = list(islice(reader, arguments.chunk_size))
+                if len(rows) == 0:
+                    break
+                nr_of_points += resolve_chunk(timezone_finder, rows, arguments)
+                # the results of every chunk are being written right away
+                writer.writerows(rows)
+                output_file.flush()
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+
+    if output_file is not sys.stdout:
+        output_file.close()
+
+    duration = time.time() - start_time
+    print('resolved {} points in {:.2f}s ({:.0f} points/s)'.format(nr_of_points, duration,
+                                                                   nr_of_points / max(duration, 10 ** -9)),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
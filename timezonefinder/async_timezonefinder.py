@@ -0,0 +1,142 @@
+"""
+asyncio wrapper around TimezoneFinder (Python 3.5+ only, hence not being imported in __init__)
+
+    from timezonefinder.async_timezonefinder import AsyncTimezoneFinder
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from .timezonefinder import TimezoneFinder
+
+# the instances of the worker processes of a ProcessPoolExecutor (s. _lookup_in_process())
+_process_instances = {}
+
+
+def _lookup_in_process(parameters, function_name, args, kwargs):
+    # every process creates its instance only once (instead of unpickling one for every lookup)
+    key = tuple(sorted(parameters.items()))
+    timezone_finder = _process_instances.get(key)
+    if timezone_finder is None:
+        timezone_finder = TimezoneFinder(**parameters)
+        _process_instances[key] = timezone_finder
+    return getattr(timezone_finder, function_name)(*args, **kwargs)
+
+
+class AsyncTimezoneFinder:
+    """
+    Runs the lookups of a TimezoneFinder in an executor, so they don't block the event loop.
+    Concurrent single point requests (timezone_at() and certain_timezone_at()) are being collected
+    for [batch_window] seconds and then looked up together with one batch lookup (timezone_at_many()...).
+
+    :param timezone_finder: the TimezoneFinder to use. None creates one with the default parameters
+    :param executor: the concurrent.futures executor to run the lookups in. None uses the default executor of the loop.
+        With a ProcessPoolExecutor every worker process creates its own instance (with the same parameters) once.
+        Use the 'spawn' start method for it (mp_context on Python 3.7+, else multiprocessing.set_start_method()):
+        the threading layers of numba are not all fork safe.
+    :param batch_window: the time in seconds single point requests are being collected before they are looked up
+    :param max_batch_size: a batch is being looked up immediately when it reaches this number of points
+    """
+
+    def __init__(self, timezone_finder=None, executor=None, batch_window=0.002, max_batch_size=1000):
+        if timezone_finder is None:
+            timezone_finder = TimezoneFinder()
+        self.timezone_finder = timezone_finder
+        self.executor = executor
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+
+        # the waiting single point requests (lng, lat, future) per batch function
+        self.batches = {'timezone_at_many': [], 'certain_timezone_at_many': []}
+        # the timers flushing the batches after the batch window
+        self.flush_handles = {}
+
+    def _run(self, function_name, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        if isinstance(self.executor, ProcessPoolExecutor):
+            function = partial(_lookup_in_process, self.timezone_finder.parameters, function_name, args, kwargs)
+        else:
+            function = partial(getattr(self.timezone_finder, function_name), *args, **kwargs)
+        return loop.run_in_executor(self.executor, function)
+
+    async def _submit(self, function_name, lng, lat):
+        # an invalid point must not make the whole batch fail
+        # (NaN fails every comparison, so the valid range is being checked)
+        if not (-180.0 <= lng <= 180.0 and -90.0 <= lat <= 90.0):
+            raise ValueError('The coordinates are out ouf bounds: (', lng, ',', lat, ')')
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        batch = self.batches[function_name]
+        batch.append((lng, lat, future))
+        if len(batch) >= self.max_batch_size:
+            self._flush(function_name)
+        elif len(batch) == 1:
+            self.flush_handles[function_name] = loop.call_later(self.batch_window, self._flush, function_name)
+        return await future
+
+    def _flush(self, function_name):
+        batch = self.batches[function_name]
+        self.batches[function_name] = []
+        handle = self.flush_handles.pop(function_name, None)
+        if handle is not None:
+            handle.cancel()
+        if len(batch) == 0:
+            return
+
+        def distribute(done):
+            # pass the results (or the exception) on to the single requests
+            exception = None if done.cancelled() else done.exception()
+            results = None if done.cancelled() or exception is not None else done.result()
+            for i, (lng, lat, future) in enumerate(batch):
+                if future.done():
+                    # the request has been cancelled
+                    continue
+                if done.cancelled():
+                    future.cancel()
+                elif exception is not None:
+                    future.set_exception(exception)
+                else:
+                    future.set_result(results[i])
+
+        lngs = [lng for lng, lat, future in batch]
+        lats = [lat for lng, lat, future in batch]
+        self._run(function_name, lngs, lats).add_done_callback(distribute)
+
+    async def timezone_at(self, lng=0.0, lat=0.0):
+        """
+        s. TimezoneFinder.timezone_at(), looked up together with the other concurrent requests
+        """
+        return await self._submit('timezone_at_many', lng, lat)
+
+    async def certain_timezone_at(self, lng=0.0, lat=0.0):
+        """
+        s. TimezoneFinder.certain_timezone_at(), looked up together with the other concurrent requests
+        """
+        return await self._submit('certain_timezone_at_many', lng, lat)
+
+    async def closest_timezone_at(self, lng, lat, delta_degree=1):
+        """
+        s. TimezoneFinder.closest_timezone_at() (no batching)
+        """
+        return await self._run('closest_timezone_at', lng, lat, delta_degree)
+
+    async def closest_timezones(self, lng, lat, k=3, max_distance_km=None):
+        """
+        s. TimezoneFinder.closest_timezones() (no batching)
+        """
+        return await self._run('closest_timezones', lng, lat, k, max_distance_km)
+
+    async def timezone_at_many(self, lngs, lats, **kwargs):
+        """
+        s. TimezoneFinder.timezone_at_many()
+        """
+        return await self._run('timezone_at_many', lngs, lats, **kwargs)
+
+    async def certain_timezone_at_many(self, lngs, lats, **kwargs):
+        """
+        s. TimezoneFinder.certain_timezone_at_many()
+        """
+        return await self._run('certain_timezone_at_many', lngs, lats, **kwargs)
@@ -0,0 +1,80 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """
+    A thread safe cache with a bounded size which evicts the least recently used entries first.
+    Every entry has a size (1 by default), the sum of all sizes never exceeds max_size.
+    :param max_size: the maximum size of all the entries in the cache together
+    :param size_of: function returning the size of a value (e.g. the number of bytes it takes up)
+    """
+
+    def __init__(self, max_size, size_of=None):
+        if max_size < 0:
+            raise ValueError('The size of the cache must not be negative:', max_size)
+        self.max_size = max_size
+        self.size_of = size_of
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _size(self, value):
+        if self.size_of is None:
+            return 1
+        return self.size_of(value)
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                # move the entry to the end (= most recently used)
+                value = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self._size(value)
+        if size > self.max_size:
+            # this would evict all the other entries and still not fit in
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= self._size(self.entries.pop(key))
+            # evict the least recently used entries until there is enough space
+            while self.size + size > self.max_size:
+                self.size -= self._size(self.entries.popitem(last=False)[1])
+            self.entries[key] = value
+            self.size += size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        :return: a dict with the statistics of the cache
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'size': self.size,
+                'max_size': self.max_size,
+            }
@@ -7,14 +7,19 @@ from struct import pack
 
 from helpers import coord2int, int2coord
 
-# Don't change this setup or timezonefinder wont work!
-# different setups of shortcuts are not supported, because then addresses in the .bin
-# would need to be calculated depending on how many shortcuts are being used.
+# the default resolution of the shortcut grid. it is being stored in the header of the .bin
+# (tests evaluated this to be the fastest setup when being used with numba)
 # number of shortcuts per longitude
 NR_SHORTCUTS_PER_LNG = 1
 # shortcuts per latitude
 NR_SHORTCUTS_PER_LAT = 2
 
+# number of polygons (H), address of the shortcut section (I), shortcuts per degree lng and lat (H, H)
+HEADER_SIZE = 10
+
+# is being written for shortcuts without polygons or with polygons of more than one zone
+NO_UNIQUE_ID = 65535
+
 all_tz_names = []
 ids = []
 boundaries = []
@@ -172,7 +177,15 @@ def _length_of_rows():
         yield length
 
 
-def compile_into_binary(path='tz_binary.bin'):
+def compile_into_binary(path='tz_binary.bin', nr_shortcuts_per_lng=NR_SHORTCUTS_PER_LNG,
+                        nr_shortcuts_per_lat=NR_SHORTCUTS_PER_LAT):
+    """
+    :param path: where the .bin should be written to
+    :param nr_shortcuts_per_lng: the number of shortcuts per degree of longitude
+    :param nr_shortcuts_per_lat: the number of shortcuts per degree of latitude
+        a finer grid leads to less polygons per shortcut (faster queries), but a bigger file.
+        the resolution is being stored in the header of the .bin
+    """
     nr_of_floats = 0
     nr_of_lines = 0
     zone_ids = []
@@ -182,17 +195,17 @@ def compile_into_binary(path='tz_binary.bin'):
         # if lng < -180 or lng >= 180:
         # print(lng)
         # raise ValueError('longitude out of bounds')
-        return math.floor((lng + 180) * NR_SHORTCUTS_PER_LNG)
+        return math.floor((lng + 180) * nr_shortcuts_per_lng)
 
     def y_shortcut(lat):
         # if lat < -90 or lat >= 90:
         # print(lat)
         # raise ValueError('this latitude is out of bounds')
-        return math.floor((90 - lat) * NR_SHORTCUTS_PER_LAT)
+        return math.floor((90 - lat) * nr_shortcuts_per_lat)
 
     def big_zone(xmax, xmin, ymax, ymin):
         # returns True if a zone with those boundaries could have more than 4 shortcuts
-        return xmax - xmin > 2 / NR_SHORTCUTS_PER_LNG and ymax - ymin > 2 / NR_SHORTCUTS_PER_LAT
+        return xmax - xmin > 2 / nr_shortcuts_per_lng and ymax - ymin > 2 / nr_shortcuts_per_lat
 
     def included_shortcut_row_nrs(max_lat, min_lat):
         return list(range(y_shortcut(max_lat), y_shortcut(min_lat) + 1))
@@ -202,9 +215,9 @@ def compile_into_binary(path='tz_binary.bin'):
 
     def longitudes_to_check(max_lng, min_lng):
         output_list = []
-        step = 1 / NR_SHORTCUTS_PER_LNG
-        current = math.ceil(min_lng * NR_SHORTCUTS_PER_LNG) / NR_SHORTCUTS_PER_LNG
-        end = math.floor(max_lng * NR_SHORTCUTS_PER_LNG) / NR_SHORTCUTS_PER_LNG
+        step = 1 / nr_shortcuts_per_lng
+        current = math.ceil(min_lng * nr_shortcuts_per_lng) / nr_shortcuts_per_lng
+        end = math.floor(max_lng * nr_shortcuts_per_lng) / nr_shortcuts_per_lng
         while current < end:
             output_list.append(current)
             current += step
@@ -214,9 +227,9 @@ def compile_into_binary(path='tz_binary.bin'):
 
     def latitudes_to_check(max_lat, min_lat):
         output_list = []
-        step = 1 / NR_SHORTCUTS_PER_LAT
-        current = math.ceil(min_lat * NR_SHORTCUTS_PER_LAT) / NR_SHORTCUTS_PER_LAT
-        end = math.floor(max_lat * NR_SHORTCUTS_PER_LAT) / NR_SHORTCUTS_PER_LAT
+        step = 1 / nr_shortcuts_per_lat
+        current = math.ceil(min_lat * nr_shortcuts_per_lat) / nr_shortcuts_per_lat
+        end = math.floor(max_lat * nr_shortcuts_per_lat) / nr_shortcuts_per_lat
         while current < end:
             output_list.append(current)
             current += step
@@ -294,7 +307,7 @@ def compile_into_binary(path='tz_binary.bin'):
         y_longs.append(y_longs[0])
         x_longs.append(x_longs[0])
 
-        step = 1 / NR_SHORTCUTS_PER_LAT
+        step = 1 / nr_shortcuts_per_lng
         # print('checking the latitudes')
         for lat in latitudes_to_check(ymax, ymin):
             # print(lat)
@@ -358,7 +371,7 @@ def compile_into_binary(path='tz_binary.bin'):
 
         # print('now all the longitudes to check')
         # same procedure horizontally
-        step = 1 / NR_SHORTCUTS_PER_LAT
+        step = 1 / nr_shortcuts_per_lat
         for lng in longitudes_to_check(xmax, xmin):
             # print(lng)
             # print(coordinate_to_longlong(lng))
@@ -526,7 +539,7 @@ def compile_into_binary(path='tz_binary.bin'):
     print('calculating the shortcuts took:', end_time - start_time)
 
     # address where the actual polygon data starts. look in the description below to get more info
-    polygon_address = (24 * nr_of_lines + 6)
+    polygon_address = (24 * nr_of_lines + HEADER_SIZE)
 
     # for every original float now 4 bytes are needed (int32)
     shortcut_start_address = polygon_address + 4 * nr_of_floats
@@ -538,6 +551,9 @@ def compile_into_binary(path='tz_binary.bin'):
     output_file.write(pack(b'!H', nr_of_lines))
     # write start address of shortcut_data:
     output_file.write(pack(b'!I', shortcut_start_address))
+    # write the resolution of the shortcut grid
+    output_file.write(pack(b'!H', nr_shortcuts_per_lng))
+    output_file.write(pack(b'!H', nr_shortcuts_per_lat))
     # write zone_ids
     for zone_id in zone_ids:
         output_file.write(pack(b'!H', zone_id))
@@ -576,8 +592,8 @@ def compile_into_binary(path='tz_binary.bin'):
     total_entries_in_shortcuts = 0
 
     # count how many shortcut addresses will be written:
-    for x in range(360 * NR_SHORTCUTS_PER_LNG):
-        for y in range(180 * NR_SHORTCUTS_PER_LAT):
+    for x in range(360 * nr_shortcuts_per_lng):
+        for y in range(180 * nr_shortcuts_per_lat):
             try:
                 this_lines_shortcuts = shortcuts[(x, y)]
                 shortcut_entries.append(this_lines_shortcuts)
@@ -589,7 +605,7 @@ def compile_into_binary(path='tz_binary.bin'):
 
     print('The number of filled shortcut zones are:', total_entries_in_shortcuts)
 
-    if len(nr_of_entries_in_shortcut) != 64800 * NR_SHORTCUTS_PER_LNG * NR_SHORTCUTS_PER_LAT:
+    if len(nr_of_entries_in_shortcut) != 64800 * nr_shortcuts_per_lng * nr_shortcuts_per_lat:
         print(len(nr_of_entries_in_shortcut))
         raise ValueError('this number of shortcut zones is wrong')
 
@@ -601,7 +617,8 @@ def compile_into_binary(path='tz_binary.bin'):
 
     # write  Address of first Polygon_nr  in shortcut field (x,y)
     # Attention: 0 is written when no entries are in this shortcut
-    shortcut_address = output_file.tell() + 259200 * NR_SHORTCUTS_PER_LNG * NR_SHORTCUTS_PER_LAT
+    # the addresses (4 bytes each) and the unique zone ids (2 bytes each) are stored before the polygon numbers
+    shortcut_address = output_file.tell() + 388800 * nr_shortcuts_per_lng * nr_shortcuts_per_lat
     for nr in nr_of_entries_in_shortcut:
         if nr == 0:
             output_file.write(pack(b'!I', 0))
@@ -610,6 +627,17 @@ def compile_into_binary(path='tz_binary.bin'):
             # each polygon takes up 2 bytes of space
             shortcut_address += 2 * nr
 
+    # write the zone id of every shortcut whose polygons all belong to the same zone
+    # this way most of the queries can be answered without reading any polygon data
+    entries_iterator = iter(shortcut_entries)
+    for nr in nr_of_entries_in_shortcut:
+        unique_id = NO_UNIQUE_ID
+        if nr > 0:
+            zones_in_shortcut = set(zone_ids[entry] for entry in next(entries_iterator))
+            if len(zones_in_shortcut) == 1:
+                unique_id = zones_in_shortcut.pop()
+        output_file.write(pack(b'!H', unique_id))
+
     # write Line_Nrs for every shortcut
     for entries in shortcut_entries:
         for entry in entries:
@@ -639,30 +667,39 @@ approx. 28k -> use 2byte unsigned short (has range until 65k)
 
 I Address of Shortcut area (end of polygons+1) @ 2
 
-'!H'  n times [H unsigned short: zone number=ID in this line, @ 6 + 2* lineNr]
+'!H' NR_SHORTCUTS_PER_LNG @ 6
+'!H' NR_SHORTCUTS_PER_LAT @ 8
 
-'!H'  n times [H unsigned short: nr of values (coordinate PAIRS! x,y in long long) in this line, @ 6 + 2n + 2* lineNr]
+'!H'  n times [H unsigned short: zone number=ID in this line, @ 10 + 2* lineNr]
+
+'!H'  n times [H unsigned short: nr of values (coordinate PAIRS! x,y in long long) in this line, @ 10 + 2n + 2* lineNr]
 
 '!I'n times [ I unsigned int: absolute address of the byte where the polygon-data of that line starts,
-@ 6 + 4 * n +  4*lineNr]
+@ 10 + 4 * n +  4*lineNr]
 
 
 
-n times 4 int32 (take up 4*4 per line): xmax, xmin, ymax, ymin  @ 6 + 8n + 16* lineNr
+n times 4 int32 (take up 4*4 per line): xmax, xmin, ymax, ymin  @ 10 + 8n + 16* lineNr
 '!iiii'
 
 
-[starting @ 6+ 24*n = polygon data start address]
+[starting @ 10+ 24*n = polygon data start address]
 (for every line: x coords, y coords:)   stored  @ Address section (see above)
 '!i' * amount of points
 
-360 * NR_SHORTCUTS_PER_LNG * 180 * NR_SHORTCUTS_PER_LAT:
-[atm: 360* 1 * 180 * 2 = 129,600]
-129,600 times !H   number of entries in shortcut field (x,y)  @ Pointer see above
+S = 360 * NR_SHORTCUTS_PER_LNG * 180 * NR_SHORTCUTS_PER_LAT shortcuts
+[default: 360* 1 * 180 * 2 = 129,600]
+stored column by column: (0,0) (0,1) (0,2)... (1,0)...
+shortcut (x,y) is entry nr. 180 * NR_SHORTCUTS_PER_LAT * x + y in each of the following sections
+
+S times !H   number of entries in shortcut field (x,y)  @ Pointer see above
+
 
+Address of first Polygon_nr  in shortcut field (x,y) [0 if there is no entry] @  Pointer see above + 2 * S
+S times !I
 
-Address of first Polygon_nr  in shortcut field (x,y) [0 if there is no entry] @  Pointer see above + 129,600
-129,600 times !I
+unique zone id of shortcut field (x,y) [NO_UNIQUE_ID=65535 if there is no entry or more than one zone]
+S times !H  @  Pointer see above + 6 * S
 
 [X = number of filled shortcuts]
 X times !H * amount Polygon_Nr    @ address stored in previous section
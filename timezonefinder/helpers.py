@@ -1,6 +1,12 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from math import asin, atan2, ceil, cos, degrees, radians, sin, sqrt
+from math import acos, asin, atan2, ceil, cos, degrees, radians, sin, sqrt
+
+from numpy import array, count_nonzero, nonzero, roll, zeros
+
+# above this number of points inside_polygon() tests all the edges at once with numpy
+# (below the overhead of the numpy calls is bigger than the time saved)
+VECTORIZED_MIN_POINTS = 100
 
 
 def position_to_line(x, y, x1, x2, y1, y2):
@@ -109,6 +115,9 @@ def position_to_line(x, y, x1, x2, y1, y2):
 
 
 def inside_polygon(x, y, coords):
+    if len(coords[0]) > VECTORIZED_MIN_POINTS:
+        return inside_polygon_vectorized(x, y, coords)
+
     wn = 0
     i = 0
     y1 = coords[1][0]
@@ -156,6 +165,95 @@ def inside_polygon(x, y, coords):
     return wn != 0
 
 
+def inside_polygon_vectorized(x, y, coords):
+    """
+    same winding number algorithm as inside_polygon(), but all edges are being processed at once with numpy
+    (the results are exactly the same, the intersections are computed with the same float operations)
+    """
+    # only the edges from the point i-1 to the point i which cross the horizontal line through pX are relevant
+    y_above = coords[1] >= y
+    crossing = nonzero(y_above != roll(y_above, 1))[0]
+    if len(crossing) == 0:
+        return False
+
+    # index -1 is the last point (edge closing the polygon)
+    x1 = coords[0][crossing - 1].astype('f8')
+    x2 = coords[0][crossing].astype('f8')
+    y1 = coords[1][crossing - 1].astype('f8')
+    y2 = coords[1][crossing].astype('f8')
+
+    # the x-intersection of the edge lies right of pX (s. position_to_line())
+    # upwards: pX is left of the edge (wn += 1)  downwards: pX is right of the edge (wn -= 1)
+    right = (y - y1) * ((x2 - x1) / (y2 - y1)) + x1 - x > 0
+    nr_upwards = count_nonzero(right & y_above[crossing])
+    return nr_upwards != count_nonzero(right) - nr_upwards
+
+
+def inside_polygon_many(xs, ys, coords):
+    """
+    tests many points against one polygon (same results as inside_polygon() for every point)
+    :param xs: the int32 x coordinates of the points
+    :param ys: the int32 y coordinates of the points
+    :param coords: the coordinates of the polygon [[x...], [y...]]
+    :return: a boolean array, True for the points being included in the polygon
+    """
+    nr_points = len(coords[0])
+    if len(xs) <= nr_points:
+        # point by point (big polygons are being processed vectorized for each point)
+        return array([inside_polygon(x, y, coords) for x, y in zip(xs, ys)], dtype=bool)
+
+    # edge by edge: each edge is being tested against all the points at once
+    xs = xs.astype('i8')
+    ys = ys.astype('i8')
+    wn = zeros(len(xs), dtype='i8')
+    # the edge from the last to the first point closes the polygon
+    x1 = int(coords[0][-1])
+    y1 = int(coords[1][-1])
+    for i in range(nr_points):
+        x2 = int(coords[0][i])
+        y2 = int(coords[1][i])
+        if y1 != y2:
+            # only the points whose horizontal line is being crossed by the edge are relevant
+            crossing = nonzero((ys > y1) != (ys > y2))[0]
+            if len(crossing) > 0:
+                # the x-intersection of the edge lies right of pX (s. position_to_line())
+                right = crossing[(ys[crossing] - y1) * ((x2 - x1) / (y2 - y1)) + x1 - xs[crossing] > 0]
+                if y1 < y2:
+                    # upwards: pX is left of the edge
+                    wn[right] += 1
+                else:
+                    # downwards: pX is right of the edge
+                    wn[right] -= 1
+        x1 = x2
+        y1 = y2
+    return wn != 0
+
+
+def inside_which_polygon(x, y, polygon_nrs, boundaries, nr_of_values, polygon_offsets, coordinates):
+    """
+    the whole loop over the candidate polygons of a point (boundaries check and point in polygon test)
+    with all the polygons being stored in one coordinate pool (s. TimezoneFinder(in_memory=True))
+    :param x: the int32 x coordinate of the point
+    :param y: the int32 y coordinate of the point
+    :param polygon_nrs: the candidate polygons in the order they should be checked
+    :param boundaries: the boundaries (xmax, xmin, ymax, ymin) of all polygons
+    :param nr_of_values: the number of points of all polygons
+    :param polygon_offsets: the index of the first x coordinate of all polygons in the pool
+    :param coordinates: the coordinate pool
+    :return: the index (in polygon_nrs) of the first polygon including the point or -1
+    """
+    for i in range(len(polygon_nrs)):
+        polygon_nr = polygon_nrs[i]
+        if x > boundaries[polygon_nr, 0] or x < boundaries[polygon_nr, 1] or \
+                y > boundaries[polygon_nr, 2] or y < boundaries[polygon_nr, 3]:
+            continue
+        offset = polygon_offsets[polygon_nr]
+        nr_points = nr_of_values[polygon_nr]
+        if inside_polygon(x, y, coordinates[offset:offset + 2 * nr_points].reshape((2, nr_points))):
+            return i
+    return -1
+
+
 def cartesian2rad(x, y, z):
     return atan2(y, x), asin(z)
 
@@ -208,6 +306,54 @@ def haversine(lng_p1, lat_p1, lng_p2, lat_p2):
     return 2 * asin(sqrt(sin((lat_p1 - lat_p2) / 2) ** 2 + cos(lat_p2) * cos(lat_p1) * sin((lng_p1 - lng_p2) / 2) ** 2))
 
 
+def distance_to_meridian_section(lng_rad, lat_rad, meridian_rad, lat_min_rad, lat_max_rad):
+    """
+    :param lng_rad: the longitude of the point in radians
+    :param lat_rad: the latitude of the point in radians
+    :param meridian_rad: the longitude of the meridian in radians
+    :param lat_min_rad: the latitude where the section of the meridian starts in radians
+    :param lat_max_rad: the latitude where the section of the meridian ends in radians
+    :return: shortest distance between the point and the section of the meridian in radians
+    """
+    cos_delta_lng = cos(lng_rad - meridian_rad)
+    if cos_delta_lng > 0:
+        # latitude of the closest point on the whole (half) meridian
+        closest_lat_rad = atan2(sin(lat_rad), cos(lat_rad) * cos_delta_lng)
+        if lat_min_rad <= closest_lat_rad <= lat_max_rad:
+            # cross track distance
+            return asin(min(abs(sin(lng_rad - meridian_rad)) * cos(lat_rad), 1.0))
+
+    # otherwise one of the end points of the section is the closest point
+    return min(haversine(lng_rad, lat_rad, meridian_rad, lat_min_rad),
+               haversine(lng_rad, lat_rad, meridian_rad, lat_max_rad))
+
+
+def distance_to_rectangle(lng, lat, lng_max, lng_min, lat_max, lat_min):
+    """
+    this is a lower bound for the distance to every polygon (section) within these boundaries
+    :param lng: lng of px in degree
+    :param lat: lat of px in degree
+    :param lng_max: the boundaries of the rectangle in degree (as stored for the polygons)
+    :param lng_min:
+    :param lat_max:
+    :param lat_min:
+    :return: shortest distance between pX and the rectangle in radians (0 if it is included)
+    """
+    # the difference in latitude is a lower bound for the distance of two points.
+    # when pX lies between the two meridians of the rectangle (also beyond the 180 deg lng border!)
+    # this is the shortest distance
+    if (lng - lng_min) % 360 <= lng_max - lng_min:
+        return radians(max(lat_min - lat, lat - lat_max, 0.0))
+
+    # otherwise the closest point lies on one of the two meridian sections (also the corners)
+    lng_rad = radians(lng)
+    lat_rad = radians(lat)
+    lat_min_rad = radians(lat_min)
+    lat_max_rad = radians(lat_max)
+    return min(distance_to_meridian_section(lng_rad, lat_rad, radians(lng_min), lat_min_rad, lat_max_rad),
+               distance_to_meridian_section(lng_rad, lat_rad, radians(lng_max), lat_min_rad, lat_max_rad))
+
+
 def compute_min_distance(lng, lat, p0_lng, p0_lat, pm1_lng, pm1_lat, p1_lng, p1_lat):
     """
     :param lng: lng of px in degree
@@ -297,3 +443,53 @@ def distance_to_polygon(lng, lat, nr_points, points, trans_points):
         pm1_lat = p1_lat
 
     return min_distance
+
+
+def distance_to_polygon_vectors(px, py, pz, vectors):
+    """
+    computes the distance with vector algebra only (no rotations, just one trigonometric function in total)
+    :param px: x of the unit vector of the point (s. coords2cartesian)
+    :param py: y of the unit vector of the point
+    :param pz: z of the unit vector of the point
+    :param vectors: the unit vectors of all the points of the polygon [[x...], [y...], [z...]]
+    :return: shortest distance between pX and the polygon (edges being great circle arcs) in radians
+    """
+    nr_points = vectors.shape[1]
+    # the cosine of the shortest distance so far (cos is decreasing on [0, pi])
+    max_cos_distance = -1.0
+
+    # start with the edge from the last to the first point
+    ax = vectors[0][nr_points - 1]
+    ay = vectors[1][nr_points - 1]
+    az = vectors[2][nr_points - 1]
+    for i in range(nr_points):
+        bx = vectors[0][i]
+        by = vectors[1][i]
+        bz = vectors[2][i]
+
+        # distance to the point b itself
+        cos_distance = px * bx + py * by + pz * bz
+        if cos_distance > max_cos_distance:
+            max_cos_distance = cos_distance
+
+        # n = a x b is the normal of the great circle through a and b
+        nx = ay * bz - az * by
+        ny = az * bx - ax * bz
+        nz = ax * by - ay * bx
+        norm_squared = nx * nx + ny * ny + nz * nz
+        if norm_squared > 0.0:
+            # the closest point of the great circle lies between a and b
+            # when (a x p) and (p x b) both point in the same direction as n
+            if ((ay * pz - az * py) * nx + (az * px - ax * pz) * ny + (ax * py - ay * px) * nz >= 0.0 and
+                    (py * bz - pz * by) * nx + (pz * bx - px * bz) * ny + (px * by - py * bx) * nz >= 0.0):
+                # the sine of the distance to the great circle is the component of p along the normal
+                dot_normal = px * nx + py * ny + pz * nz
+                cos_distance = sqrt(max(1.0 - dot_normal * dot_normal / norm_squared, 0.0))
+                if cos_distance > max_cos_distance:
+                    max_cos_distance = cos_distance
+
+        ax = bx
+        ay = by
+        az = bz
+
+    return acos(min(max_cos_distance, 1.0))
@@ -1,11 +1,13 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from math import asin, atan2, ceil, cos, degrees, radians, sin, sqrt
+from math import acos, asin, atan2, ceil, cos, degrees, floor, radians, sin, sqrt
 
-from numba import jit
+from numba import jit, prange
+from numpy import bool_ as np_bool
+from numpy import empty, int32
 
 
-@jit('uint(i4,i4,i4,i4,i4,i4)', nopython=True, cache=True)
+@jit('uint(i4,i4,i4,i4,i4,i4)', nopython=True, nogil=True, cache=True)
 def position_to_line(x, y, x1, x2, y1, y2):
     """tests if a point pX(x,y) is Left|On|Right of an infinite line from p1 to p2
         Return: 2 for pX left of the line from! p1 to! p2
@@ -111,7 +113,7 @@ def position_to_line(x, y, x1, x2, y1, y2):
                 return 0
 
 
-@jit('b1(i4,i4,i4[:,:])', nopython=True, cache=True)
+@jit('b1(i4,i4,i4[:,:])', nopython=True, nogil=True, cache=True)
 def inside_polygon(x, y, coords):
     wn = 0
     i = 0
@@ -160,17 +162,117 @@ def inside_polygon(x, y, coords):
     return wn != 0
 
 
-@jit(nopython=True, cache=True)
+@jit('b1[:](i4[:],i4[:],i4[:,:])', nopython=True, nogil=True, cache=True)
+def inside_polygon_many(xs, ys, coords):
+    """
+    tests many points against one polygon (same results as inside_polygon() for every point)
+    :param xs: the int32 x coordinates of the points
+    :param ys: the int32 y coordinates of the points
+    :param coords: the coordinates of the polygon [[x...], [y...]]
+    :return: a boolean array, True for the points being included in the polygon
+    """
+    results = empty(len(xs), dtype=np_bool)
+    for i in range(len(xs)):
+        results[i] = inside_polygon(xs[i], ys[i], coords)
+    return results
+
+
+@jit('i8(i4,i4,i8[:],i4[:,:],i8[:],i8[:],i4[::1])', nopython=True, nogil=True, cache=True)
+def inside_which_polygon(x, y, polygon_nrs, boundaries, nr_of_values, polygon_offsets, coordinates):
+    """
+    the whole loop over the candidate polygons of a point (boundaries check and point in polygon test)
+    with all the polygons being stored in one coordinate pool (s. TimezoneFinder(in_memory=True))
+    :param x: the int32 x coordinate of the point
+    :param y: the int32 y coordinate of the point
+    :param polygon_nrs: the candidate polygons in the order they should be checked
+    :param boundaries: the boundaries (xmax, xmin, ymax, ymin) of all polygons
+    :param nr_of_values: the number of points of all polygons
+    :param polygon_offsets: the index of the first x coordinate of all polygons in the pool
+    :param coordinates: the coordinate pool
+    :return: the index (in polygon_nrs) of the first polygon including the point or -1
+    """
+    for i in range(len(polygon_nrs)):
+        polygon_nr = polygon_nrs[i]
+        if x > boundaries[polygon_nr, 0] or x < boundaries[polygon_nr, 1] or \
+                y > boundaries[polygon_nr, 2] or y < boundaries[polygon_nr, 3]:
+            continue
+        offset = polygon_offsets[polygon_nr]
+        nr_points = nr_of_values[polygon_nr]
+        if inside_polygon(x, y, coordinates[offset:offset + 2 * nr_points].reshape((2, nr_points))):
+            return i
+    return -1
+
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def zone_ids_of_points(lngs, lats, certain, nr_shortcuts_per_lng, nr_shortcuts_per_lat, unique_ids, shortcut_offsets,
+                       shortcut_entries, zone_ids, boundaries, nr_of_values, polygon_offsets, coordinates):
+    """
+    the whole lookup of a batch of points in compiled code (the points are being processed in parallel)
+    with all the data being stored in native arrays (s. TimezoneFinder(in_memory=True))
+    same results as timezone_at() (certain=False) or certain_timezone_at() (certain=True) for every point
+    :param lngs: the longitudes of the points in degree (should be checked to be within the bounds before,
+        invalid points get no result)
+    :param lats: the latitudes of the points in degree
+    :param certain: True: always run the point in polygon test (do not use the unique zone ids of the shortcuts)
+    :param nr_shortcuts_per_lng: the resolution of the shortcut grid
+    :param nr_shortcuts_per_lat: the resolution of the shortcut grid
+    :param unique_ids: the zone id of every shortcut whose polygons all belong to the same zone (else 65535)
+    :param shortcut_offsets: the polygons of shortcut i are shortcut_entries[shortcut_offsets[i]:shortcut_offsets[i+1]]
+    :param shortcut_entries: the polygons of all shortcuts
+    :param zone_ids: the zone ids of all polygons
+    :param boundaries: the boundaries (xmax, xmin, ymax, ymin) of all polygons
+    :param nr_of_values: the number of points of all polygons
+    :param polygon_offsets: the index of the first x coordinate of all polygons in the pool
+    :param coordinates: the coordinate pool
+    :return: the zone id of every point (-1 when there is no result)
+    """
+    nr_of_columns = 360 * nr_shortcuts_per_lng
+    nr_of_rows = 180 * nr_shortcuts_per_lat
+    results = empty(len(lngs), dtype=int32)
+    for i in prange(len(lngs)):
+        results[i] = -1
+        # no result for invalid points (e.g. NaN) instead of reading outside of the arrays
+        if not (-180.0 <= lngs[i] <= 180.0 and -90.0 <= lats[i] <= 90.0):
+            continue
+
+        # same conversion as in TimezoneFinder.shortcut_of()
+        shortcut_x = min(int(floor((lngs[i] + 180) * nr_shortcuts_per_lng)), nr_of_columns - 1)
+        shortcut_y = min(int(floor((90 - lats[i]) * nr_shortcuts_per_lat)), nr_of_rows - 1)
+        if shortcut_x < 0 or shortcut_y < 0:
+            continue
+        shortcut_nr = nr_of_rows * shortcut_x + shortcut_y
+        if not certain and unique_ids[shortcut_nr] != 65535:
+            # all the polygons belong to the same zone
+            results[i] = unique_ids[shortcut_nr]
+            continue
+
+        # same conversion as in coord2int()
+        x = int32(int(lngs[i] * 10 ** 7))
+        y = int32(int(lats[i] * 10 ** 7))
+        for entry in range(shortcut_offsets[shortcut_nr], shortcut_offsets[shortcut_nr + 1]):
+            polygon_nr = shortcut_entries[entry]
+            if x > boundaries[polygon_nr, 0] or x < boundaries[polygon_nr, 1] or \
+                    y > boundaries[polygon_nr, 2] or y < boundaries[polygon_nr, 3]:
+                continue
+            offset = polygon_offsets[polygon_nr]
+            nr_points = nr_of_values[polygon_nr]
+            if inside_polygon(x, y, coordinates[offset:offset + 2 * nr_points].reshape((2, nr_points))):
+                results[i] = zone_ids[polygon_nr]
+                break
+    return results
+
+
+@jit(nopython=True, nogil=True, cache=True)
 def cartesian2rad(x, y, z):
     return atan2(y, x), asin(z)
 
 
-@jit(nopython=True, cache=True)
+@jit(nopython=True, nogil=True, cache=True)
 def cartesian2coords(x, y, z):
     return degrees(atan2(y, x)), degrees(asin(z))
 
 
-@jit(nopython=True, cache=True)
+@jit(nopython=True, nogil=True, cache=True)
 def x_rotate(rad, point):
     # Attention: this rotation uses radians!
     # x stays the same
@@ -179,7 +281,7 @@ def x_rotate(rad, point):
     return point[0], point[1] * cos_rad + point[2] * sin_rad, point[2] * cos_rad - point[1] * sin_rad
 
 
-@jit(nopython=True, cache=True)
+@jit(nopython=True, nogil=True, cache=True)
 def y_rotate(degree, point):
     # y stays the same
     degree = radians(-degree)
@@ -188,14 +290,14 @@ def y_rotate(degree, point):
     return point[0] * cos_rad - point[2] * sin_rad, point[1], point[0] * sin_rad + point[2] * cos_rad
 
 
-@jit(nopython=True, cache=True)
+@jit(nopython=True, nogil=True, cache=True)
 def coords2cartesian(lng, lat):
     lng = radians(lng)
     lat = radians(lat)
     return cos(lng) * cos(lat), sin(lng) * cos(lat), sin(lat)
 
 
-@jit(nopython=True, cache=True)
+@jit(nopython=True, nogil=True, cache=True)
 def distance_to_point_on_equator(lng_rad, lat_rad, lng_rad_p1):
     """
     uses the simplified haversine formula for this special case
@@ -207,7 +309,7 @@ def distance_to_point_on_equator(lng_rad, lat_rad, lng_rad_p1):
     return 2 * asin(sqrt((sin(lat_rad) / 2) ** 2 + cos(lat_rad) * sin((lng_rad - lng_rad_p1) / 2) ** 2))
 
 
-@jit(nopython=True, cache=True)
+@jit(nopython=True, nogil=True, cache=True)
 def haversine(lng_p1, lat_p1, lng_p2, lat_p2):
     """
     :param lng_p1: the longitude of point 1 in radians
@@ -219,7 +321,57 @@ def haversine(lng_p1, lat_p1, lng_p2, lat_p2):
     return 2 * asin(sqrt(sin((lat_p1 - lat_p2) / 2) ** 2 + cos(lat_p2) * cos(lat_p1) * sin((lng_p1 - lng_p2) / 2) ** 2))
 
 
-@jit(nopython=True, cache=True)
+@jit(nopython=True, nogil=True, cache=True)
+def distance_to_meridian_section(lng_rad, lat_rad, meridian_rad, lat_min_rad, lat_max_rad):
+    """
+    :param lng_rad: the longitude of the point in radians
+    :param lat_rad: the latitude of the point in radians
+    :param meridian_rad: the longitude of the meridian in radians
+    :param lat_min_rad: the latitude where the section of the meridian starts in radians
+    :param lat_max_rad: the latitude where the section of the meridian ends in radians
+    :return: shortest distance between the point and the section of the meridian in radians
+    """
+    cos_delta_lng = cos(lng_rad - meridian_rad)
+    if cos_delta_lng > 0:
+        # latitude of the closest point on the whole (half) meridian
+        closest_lat_rad = atan2(sin(lat_rad), cos(lat_rad) * cos_delta_lng)
+        if lat_min_rad <= closest_lat_rad <= lat_max_rad:
+            # cross track distance
+            return asin(min(abs(sin(lng_rad - meridian_rad)) * cos(lat_rad), 1.0))
+
+    # otherwise one of the end points of the section is the closest point
+    return min(haversine(lng_rad, lat_rad, meridian_rad, lat_min_rad),
+               haversine(lng_rad, lat_rad, meridian_rad, lat_max_rad))
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def distance_to_rectangle(lng, lat, lng_max, lng_min, lat_max, lat_min):
+    """
+    this is a lower bound for the distance to every polygon (section) within these boundaries
+    :param lng: lng of px in degree
+    :param lat: lat of px in degree
+    :param lng_max: the boundaries of the rectangle in degree (as stored for the polygons)
+    :param lng_min:
+    :param lat_max:
+    :param lat_min:
+    :return: shortest distance between pX and the rectangle in radians (0 if it is included)
+    """
+    # the difference in latitude is a lower bound for the distance of two points.
+    # when pX lies between the two meridians of the rectangle (also beyond the 180 deg lng border!)
+    # this is the shortest distance
+    if (lng - lng_min) % 360 <= lng_max - lng_min:
+        return radians(max(lat_min - lat, lat - lat_max, 0.0))
+
+    # otherwise the closest point lies on one of the two meridian sections (also the corners)
+    lng_rad = radians(lng)
+    lat_rad = radians(lat)
+    lat_min_rad = radians(lat_min)
+    lat_max_rad = radians(lat_max)
+    return min(distance_to_meridian_section(lng_rad, lat_rad, radians(lng_min), lat_min_rad, lat_max_rad),
+               distance_to_meridian_section(lng_rad, lat_rad, radians(lng_max), lat_min_rad, lat_max_rad))
+
+
+@jit(nopython=True, nogil=True, cache=True)
 def compute_min_distance(lng, lat, p0_lng, p0_lat, pm1_lng, pm1_lat, p1_lng, p1_lat):
     """
     :param lng: lng of px in degree
@@ -269,17 +421,17 @@ def compute_min_distance(lng, lat, p0_lng, p0_lat, pm1_lng, pm1_lat, p1_lng, p1_
                                             max(min(px_retrans_rad[0], lng_p1_rad), 0)))
 
 
-@jit('f8(i4)', nopython=True, cache=True)
+@jit('f8(i4)', nopython=True, nogil=True, cache=True)
 def int2coord(int32):
     return float(int32 / 10 ** 7)
 
 
-@jit('i4(f8)', nopython=True, cache=True)
+@jit('i4(f8)', nopython=True, nogil=True, cache=True)
 def coord2int(double):
     return int(double * 10 ** 7)
 
 
-@jit(nopython=True, cache=True)
+@jit(nopython=True, nogil=True, cache=True)
 def distance_to_polygon(lng, lat, nr_points, points, trans_points):
     # transform all points (long long) to coords
     for i in range(nr_points):
@@ -312,3 +464,54 @@ def distance_to_polygon(lng, lat, nr_points, points, trans_points):
         pm1_lat = p1_lat
 
     return min_distance
+
+
+@jit('f8(f8,f8,f8,f8[:,:])', nopython=True, nogil=True, cache=True)
+def distance_to_polygon_vectors(px, py, pz, vectors):
+    """
+    computes the distance with vector algebra only (no rotations, just one trigonometric function in total)
+    :param px: x of the unit vector of the point (s. coords2cartesian)
+    :param py: y of the unit vector of the point
+    :param pz: z of the unit vector of the point
+    :param vectors: the unit vectors of all the points of the polygon [[x...], [y...], [z...]]
+    :return: shortest distance between pX and the polygon (edges being great circle arcs) in radians
+    """
+    nr_points = vectors.shape[1]
+    # the cosine of the shortest distance so far (cos is decreasing on [0, pi])
+    max_cos_distance = -1.0
+
+    # start with the edge from the last to the first point
+    ax = vectors[0][nr_points - 1]
+    ay = vectors[1][nr_points - 1]
+    az = vectors[2][nr_points - 1]
+    for i in range(nr_points):
+        bx = vectors[0][i]
+        by = vectors[1][i]
+        bz = vectors[2][i]
+
+        # distance to the point b itself
+        cos_distance = px * bx + py * by + pz * bz
+        if cos_distance > max_cos_distance:
+            max_cos_distance = cos_distance
+
+        # n = a x b is the normal of the great circle through a and b
+        nx = ay * bz - az * by
+        ny = az * bx - ax * bz
+        nz = ax * by - ay * bx
+        norm_squared = nx * nx + ny * ny + nz * nz
+        if norm_squared > 0.0:
+            # the closest point of the great circle lies between a and b
+            # when (a x p) and (p x b) both point in the same direction as n
+            if ((ay * pz - az * py) * nx + (az * px - ax * pz) * ny + (ax * py - ay * px) * nz >= 0.0 and
+                    (py * bz - pz * by) * nx + (pz * bx - px * bz) * ny + (px * by - py * bx) * nz >= 0.0):
+                # the sine of the distance to the great circle is the component of p along the normal
+                dot_normal = px * nx + py * ny + pz * nz
+                cos_distance = sqrt(max(1.0 - dot_normal * dot_normal / norm_squared, 0.0))
+                if cos_distance > max_cos_distance:
+                    max_cos_distance = cos_distance
+
+        ax = bx
+        ay = by
+        az = bz
+
+    return acos(min(max_cos_distance, 1.0))
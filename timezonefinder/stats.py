@@ -0,0 +1,109 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from threading import Lock
+
+# the counters of the work done by the lookups
+COUNTERS = (
+    # the polygons in the shortcuts of the points
+    'shortcut_candidates',
+    # the points answered by the unique zone of their shortcut (without reading any polygon)
+    'unique_zone_hits',
+    # the candidate polygons whose boundaries do not include the point
+    'bbox_rejects',
+    # the point in polygon tests
+    'inside_polygon_calls',
+    # the vertices of all the polygons tested with the point in polygon algorithm or the distance computation
+    'vertices_scanned',
+    # the distance computations of closest_timezone_at() and closest_timezones()
+    'distance_to_polygon_calls',
+    # the bytes read from timezone_data.bin (or accessed in its mapping)
+    'bytes_read',
+)
+
+# the counters which are also being recorded per query (as histograms)
+HISTOGRAMS = ('shortcut_candidates', 'bbox_rejects', 'inside_polygon_calls', 'vertices_scanned',
+              'distance_to_polygon_calls')
+
+
+def bucket_of(value):
+    # the histograms have buckets with the upper bounds 0, 1, 2, 4, 8, 16...
+    value = int(value)
+    if value <= 0:
+        return 0
+    return 1 << (value - 1).bit_length()
+
+
+class Stats:
+    """
+    Thread safe counters and histograms of the work done by the lookups of a TimezoneFinder.
+    All the values are being collected in memory until reset() is being called.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # the number of lookups per function
+            self.queries = {}
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            # the number of queries per bucket (s. bucket_of()), the sum and the maximum of the values per query
+            self.histograms = {}
+            for name in HISTOGRAMS:
+                self.histograms[name] = {'buckets': {}, 'sum': 0, 'max': 0}
+
+    def add(self, name, amount):
+        with self.lock:
+            self.counters[name] += int(amount)
+
+    def record_query(self, function_name, **values):
+        """
+        records a single query
+        :param function_name: the name of the lookup function
+        :param values: the values of the counters (s. COUNTERS) for this query
+        """
+        with self.lock:
+            self.queries[function_name] = self.queries.get(function_name, 0) + 1
+            for name, value in values.items():
+                value = int(value)
+                self.counters[name] += value
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    continue
+                bucket = bucket_of(value)
+                histogram['buckets'][bucket] = histogram['buckets'].get(bucket, 0) + 1
+                histogram['sum'] += value
+                histogram['max'] = max(histogram['max'], value)
+
+    def record_batch(self, function_name, nr_of_points, **values):
+        """
+        records a batch of queries. only the counters are being updated (no histograms)
+        :param nr_of_points: the number of points in the batch
+        :param values: the values of the counters (s. COUNTERS) for the whole batch
+        """
+        with self.lock:
+            self.queries[function_name] = self.queries.get(function_name, 0) + int(nr_of_points)
+            for name, value in values.items():
+                self.counters[name] += int(value)
+
+    def info(self):
+        """
+        :return: a dict with the number of queries per function, the counters
+            and the histograms of the values per query: (upper bound of the bucket, number of queries) pairs
+        """
+        with self.lock:
+            histograms = {}
+            for name, histogram in self.histograms.items():
+                count = sum(histogram['buckets'].values())
+                histograms[name] = {
+                    'buckets': sorted(histogram['buckets'].items()),
+                    'count': count,
+                    'mean': histogram['sum'] / count if count else 0.0,
+                    'max': histogram['max'],
+                }
+            return {
+                'queries': dict(self.queries),
+                'counters': dict(self.counters),
+                'histograms': histograms,
+            }
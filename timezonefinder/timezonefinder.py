@@ -1,12 +1,43 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import mmap
+from collections import deque
+from heapq import heappop, heappush
+from itertools import islice
 from math import floor
+from multiprocessing.pool import ThreadPool
+from os import fstat, getpid
 from os.path import dirname, join
-from struct import unpack
+from struct import calcsize, unpack, unpack_from
+from threading import Lock
+from timeit import default_timer
+
+from numpy import all as np_all
+from numpy import arange, argsort, array, asarray, concatenate, cumsum, empty
+from numpy import cos as np_cos
+from numpy import dtype as np_dtype
+from numpy import floor as np_floor
+from numpy import frombuffer, full, lexsort, minimum, nonzero, radians, unique, zeros
+from numpy import sin as np_sin
+
+from .cache import LRUCache
+from .stats import Stats
+from .timezone_names import timezone_names
 
-from numpy import array, empty, fromfile
+try:
+    # positional reads do not change the file offset and hence are thread safe (not available on every platform)
+    from os import pread
+except ImportError:
+    pread = None
 
-from .timezone_names import timezone_names
+try:
+    # the worker processes of the batch lookups are being started as fresh interpreters:
+    # the threading layers of numba are not all fork safe
+    from multiprocessing import get_context
+    process_pool = get_context('spawn').Pool
+except ImportError:
+    # Python < 3.4
+    from multiprocessing import Pool as process_pool
 
 try:
     import numba
@@ -14,192 +45,649 @@ except ImportError:
     numba = None
 
 if numba is not None:
-    from .helpers_numba import coord2int, distance_to_polygon, inside_polygon
+    from .helpers_numba import (coord2int, coords2cartesian, distance_to_polygon_vectors, distance_to_rectangle,
+                                inside_polygon, inside_polygon_many, inside_which_polygon, zone_ids_of_points)
 else:
-    from .helpers import coord2int, distance_to_polygon, inside_polygon
+    from .helpers import (coord2int, coords2cartesian, distance_to_polygon_vectors, distance_to_rectangle,
+                          inside_polygon, inside_polygon_many, inside_which_polygon)
+
+    # the parallel lookup of a whole batch only exists compiled
+    zone_ids_of_points = None
+
+# number of polygons (H), address of the shortcut section (I), shortcuts per degree lng and lat (H, H)
+HEADER_SIZE = 10
+
+# is being raised when the header of the .bin does not fit (s. check_header())
+INVALID_FILE_MESSAGE = ('The header of the .bin does not fit to its content. The format of the .bin changed in version '
+                        '1.6.0, please create it again with the file_converter of this version:')
+
+# the mean radius of the earth, for converting the distances in radians
+EARTH_RADIUS_KM = 6371.0
+
+# the types of entries in the queue of closest_timezone_at()
+SHORTCUT = 0
+POLYGON = 1
+
+# marks a missing entry in the result cache (None is a valid result)
+NOT_CACHED = object()
+
+# is being stored for shortcuts without polygons or with polygons of more than one zone (s. file_converter)
+NO_UNIQUE_ID = 65535
+
+# the default threading layer of numba (workqueue) does not support launching parallel functions concurrently
+PARALLEL_LOCK = Lock()
+
+
+def check_header(file_size, nr_of_entries, shortcuts_start, nr_shortcuts_per_lng, nr_shortcuts_per_lat):
+    """
+    :param file_size: the size of the .bin in bytes
+    :return: True if the values of the header fit to the size of the .bin: the polygon sections end before
+        the shortcut section and the shortcut section (except for its entries) ends within the file
+    """
+    if nr_shortcuts_per_lng < 1 or nr_shortcuts_per_lat < 1:
+        return False
+    nr_of_shortcuts = 360 * nr_shortcuts_per_lng * 180 * nr_shortcuts_per_lat
+    # counts (H), addresses (I) and unique ids (H) of all shortcuts
+    return 24 * nr_of_entries + HEADER_SIZE <= shortcuts_start and shortcuts_start + 8 * nr_of_shortcuts <= file_size
 
 
 class TimezoneFinder:
     """
     This class lets you quickly find the timezone of a point on earth.
     It keeps the binary file with the timezonefinder open in reading mode to enable fast consequent access.
+    The number of shortcuts per degree of longitude and latitude is being read from the header of the file.
     In the file currently used there are two shortcuts stored per degree of latitude and one per degree of longitude
     (tests evaluated this to be the fastest setup when being used with numba)
+
+    All the queries are thread safe, so one instance can be shared by many threads.
+
+    :param use_mmap: map the whole .bin into memory once instead of seeking and reading for every field.
+        All data is then read as zero-copy views of the mapping (no system calls during the queries)
+        and the OS page cache is shared between all processes using the file.
+    :param in_memory: load all the data of the .bin into (approx. 20MB of) native numpy arrays at startup.
+        There is no I/O at all during the queries then.
+    :param polygon_cache_bytes: the maximum amount of bytes the coordinates of recently used polygons may take up.
+        The least recently used polygons are being evicted first. 0 disables the cache.
+    :param vector_cache_bytes: the maximum amount of bytes the unit vectors (x,y,z) of the points of recently used
+        polygons may take up (24 bytes per point). closest_timezone_at() computes the distances with these vectors,
+        so with the cache the trigonometric functions have to be evaluated only once per polygon. 0 disables the cache.
+    :param result_cache_size: the maximum amount of results of timezone_at() and certain_timezone_at()
+        which are being cached. The least recently used results are being evicted first. 0 disables the cache.
+    :param result_cache_precision: the number of decimal places the coordinates are being truncated to
+        before they are used as key of the result cache. All points within the same grid cell share one result.
+        The default of 7 corresponds to the int32 precision of the coordinates in the .bin.
+    :param collect_stats: count the work done by the lookups (candidate polygons, point in polygon tests,
+        bytes read...), s. stats(). Without it no counting is being done at all.
+    :param slow_query_threshold: the duration in seconds from which on calls of timezone_at(), certain_timezone_at(),
+        closest_timezone_at() and closest_timezones() are being logged as slow (s. slow_queries()).
+        None disables the log.
+    :param slow_query_log_size: the maximum amount of slow queries being kept (the oldest ones are being dropped)
+    :param slow_query_callback: function being called with every slow query (a dict, s. slow_queries()).
+        It is being called by the thread of the query and is not being pickled.
     """
 
-    def __init__(self):
+    def __init__(self, use_mmap=False, in_memory=False, polygon_cache_bytes=0, result_cache_size=0,
+                 result_cache_precision=7, vector_cache_bytes=0, collect_stats=False, slow_query_threshold=None,
+                 slow_query_log_size=100, slow_query_callback=None):
 
-        # open the file in binary reading mode
-        self.binary_file = open(join(dirname(__file__), 'timezone_data.bin'), 'rb')
+        # instances are being pickled by these parameters (s. __getstate__())
+        self.parameters = dict(use_mmap=use_mmap, in_memory=in_memory, polygon_cache_bytes=polygon_cache_bytes,
+                               result_cache_size=result_cache_size, result_cache_precision=result_cache_precision,
+                               vector_cache_bytes=vector_cache_bytes, collect_stats=collect_stats,
+                               slow_query_threshold=slow_query_threshold, slow_query_log_size=slow_query_log_size)
+
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_query_callback = slow_query_callback
+        # appending to a bounded deque is thread safe
+        self.slow_query_log = deque(maxlen=slow_query_log_size)
+
+        # the bytes read at startup are being counted as well
+        self.stats_collector = None
+        if collect_stats:
+            self.stats_collector = Stats()
+
+        self.path = join(dirname(__file__), 'timezone_data.bin')
+        self._open()
+
+        self.mapping = None
+        # the .bin has to contain at least a header (an empty file cannot be mapped)
+        file_size = fstat(self.binary_file.fileno()).st_size
+        if file_size < HEADER_SIZE:
+            raise ValueError(INVALID_FILE_MESSAGE, self.path)
+
+        if use_mmap:
+            self.mapping = mmap.mmap(self.binary_file.fileno(), 0, access=mmap.ACCESS_READ)
 
         # for more info on what is stored how in the .bin please read the comments in file_converter
         # read the first 2byte int (= number of polygons stored in the .bin)
-        self.nr_of_entries = unpack(b'!H', self.binary_file.read(2))[0]
+        self.nr_of_entries = self._unpack_at(b'!H', 0)
 
         # set addresses
         # the address where the shortcut section starts (after all the polygons) this is 34 433 054
-        self.shortcuts_start = unpack(b'!I', self.binary_file.read(4))[0]
+        self.shortcuts_start = self._unpack_at(b'!I', 2)
+
+        # the resolution of the shortcut grid
+        self.nr_shortcuts_per_lng = self._unpack_at(b'!H', 6)
+        self.nr_shortcuts_per_lat = self._unpack_at(b'!H', 8)
+        # a .bin with another format (e.g. the 6 byte header of older versions) would be misread otherwise
+        if not check_header(file_size, self.nr_of_entries, self.shortcuts_start, self.nr_shortcuts_per_lng,
+                            self.nr_shortcuts_per_lat):
+            raise ValueError(INVALID_FILE_MESSAGE, self.path)
+        # shortcuts are stored: (0,0) (0,1) (0,2)... (1,0)... = column by column
+        self.nr_of_columns = 360 * self.nr_shortcuts_per_lng
+        self.nr_of_rows = 180 * self.nr_shortcuts_per_lat
+        self.nr_of_shortcuts = self.nr_of_columns * self.nr_of_rows
+
+        self.id_start_address = HEADER_SIZE
+        self.nr_val_start_address = 2 * self.nr_of_entries + HEADER_SIZE
+        self.adr_start_address = 4 * self.nr_of_entries + HEADER_SIZE
+        self.bound_start_address = 8 * self.nr_of_entries + HEADER_SIZE
+        self.poly_start_address = 24 * self.nr_of_entries + HEADER_SIZE
+        self.first_shortcut_address = self.shortcuts_start + 2 * self.nr_of_shortcuts
+        self.unique_id_start_address = self.shortcuts_start + 6 * self.nr_of_shortcuts
+        self.shortcut_entries_start_address = self.shortcuts_start + 8 * self.nr_of_shortcuts
+
+        # the zone ids of all polygons are only 2 bytes each. they are always kept in memory
+        # for resolving the ids without any I/O
+        self.zone_ids = self._array_at(self.id_start_address, '>u2', self.nr_of_entries).astype('u2')
+        # the same holds for the boundaries (16 bytes per polygon), this way all the candidate polygons
+        # of a shortcut can be filtered at once = (lng_max, lng_min, lat_max, lat_min) of every polygon
+        self.boundaries = self._array_at(self.bound_start_address, '>i4',
+                                         4 * self.nr_of_entries).astype('i4').reshape(self.nr_of_entries, 4)
+        # and for the number of polygons and the unique zone id of every shortcut (2 bytes each),
+        # so the batch lookups can resolve all the points of empty or unique shortcuts at once
+        self.shortcut_counts = self._array_at(self.shortcuts_start, '>u2', self.nr_of_shortcuts).astype('u2')
+        self.unique_ids = self._array_at(self.unique_id_start_address, '>u2', self.nr_of_shortcuts).astype('u2')
+
+        self.in_memory = in_memory
+        if in_memory:
+            self._load_into_memory()
+        elif collect_stats or slow_query_threshold is not None:
+            # the number of vertices of every polygon (for counting and logging the vertices without extra reads)
+            self.nr_of_values = self._array_at(self.nr_val_start_address, '>u2', self.nr_of_entries).astype('i8')
+
+        self.polygon_cache = None
+        if polygon_cache_bytes:
+            self.polygon_cache = LRUCache(polygon_cache_bytes, size_of=lambda coords: coords.nbytes)
+
+        self.vector_cache = None
+        if vector_cache_bytes:
+            self.vector_cache = LRUCache(vector_cache_bytes, size_of=lambda vectors: vectors.nbytes)
+
+        self.result_cache = None
+        if result_cache_size:
+            self.result_cache = LRUCache(result_cache_size)
+            self.result_cache_factor = 10 ** result_cache_precision
+
+    def _open(self):
+        # open the file in binary reading mode
+        self.binary_file = open(self.path, 'rb')
+
+        # only needed on platforms without positional reads
+        self.file_lock = Lock()
+
+        # the process which opened the file (s. _read())
+        self.pid = getpid()
 
-        self.nr_val_start_address = 2 * self.nr_of_entries + 6
-        self.adr_start_address = 4 * self.nr_of_entries + 6
-        self.bound_start_address = 8 * self.nr_of_entries + 6
-        # self.poly_start_address = 40 * self.nr_of_entries + 6
-        self.poly_start_address = 24 * self.nr_of_entries + 6
-        self.first_shortcut_address = self.shortcuts_start + 259200
+    def __getstate__(self):
+        # open files, mappings and locks cannot be pickled. the new instance opens the file again
+        # (the caches are not being pickled)
+        return self.parameters
+
+    def __setstate__(self, state):
+        self.__init__(**state)
 
     def __del__(self):
+        if self.mapping is not None:
+            try:
+                self.mapping.close()
+            except BufferError:
+                # there are still arrays referencing the mapping. it gets closed when they are garbage collected
+                pass
         self.binary_file.close()
 
     @staticmethod
     def using_numba():
         return (numba is not None)
 
+    def _read(self, address, nr_of_bytes):
+        if self.pid != getpid():
+            # the instance was created before a fork(). the child process gets its own file
+            # otherwise the processes would share the file offset (and the lock would not protect it)
+            self.binary_file.close()
+            self._open()
+
+        # seek() and read() would not be thread safe, because all threads share the same file offset
+        if pread is not None:
+            return pread(self.binary_file.fileno(), nr_of_bytes, address)
+        with self.file_lock:
+            self.binary_file.seek(address)
+            return self.binary_file.read(nr_of_bytes)
+
+    def _unpack_at(self, fmt, address):
+        # read a single value stored at the given address of the .bin
+        if self.stats_collector is not None:
+            self.stats_collector.add('bytes_read', calcsize(fmt))
+        if self.mapping is not None:
+            return unpack_from(fmt, self.mapping, address)[0]
+        return unpack(fmt, self._read(address, calcsize(fmt)))[0]
+
+    def _array_at(self, address, dtype, count):
+        # read [count] consecutive values of type [dtype] starting at the given address of the .bin
+        if self.stats_collector is not None:
+            self.stats_collector.add('bytes_read', np_dtype(dtype).itemsize * count)
+        if self.mapping is not None:
+            # no copy is being made, the array is a view of the mapped file
+            return frombuffer(self.mapping, dtype=dtype, count=count, offset=address)
+        return frombuffer(self._read(address, np_dtype(dtype).itemsize * count), dtype=dtype, count=count)
+
+    def _load_into_memory(self):
+        # every section of the .bin is being read at once and converted into a native array
+        n = self.nr_of_entries
+        self.nr_of_values = self._array_at(self.nr_val_start_address, '>u2', n).astype('i8')
+        # all the polygons are stored in one coordinate pool.
+        # the offset of a polygon is the index of its first x coordinate in the pool
+        self.polygon_offsets = (self._array_at(self.adr_start_address, '>u4', n).astype('i8') -
+                                self.poly_start_address) // 4
+        self.coordinates = self._array_at(self.poly_start_address, '>i4',
+                                          (self.shortcuts_start - self.poly_start_address) // 4).astype('i4')
+
+        # the shortcuts are stored in compressed sparse row format:
+        # the polygons of shortcut i are shortcut_entries[shortcut_offsets[i]:shortcut_offsets[i + 1]]
+        self.shortcut_offsets = zeros(self.nr_of_shortcuts + 1, dtype='i8')
+        cumsum(self.shortcut_counts, out=self.shortcut_offsets[1:])
+        self.shortcut_entries = self._array_at(self.shortcut_entries_start_address, '>u2',
+                                               self.shortcut_offsets[-1]).astype('u2')
+
     def id_of(self, line=0):
-        # ids start at address 6. per line one unsigned 2byte int is used
-        self.binary_file.seek((6 + 2 * line))
-        return unpack(b'!H', self.binary_file.read(2))[0]
+        return int(self.zone_ids[line])
 
     def ids_of(self, iterable):
+        return self.zone_ids[asarray(iterable, dtype='i8')]
 
-        id_array = empty(shape=len(iterable), dtype='>i1')
-
-        i = 0
-        for line_nr in iterable:
-            self.binary_file.seek((6 + 2 * line_nr))
-            id_array[i] = unpack(b'!H', self.binary_file.read(2))[0]
-            i += 1
-
-        return id_array
+    def shortcut_of(self, lng=0.0, lat=0.0):
+        # convert coords into shortcut
+        # the points on the 180 deg lng border (and on the south pole) belong to the last column (row)
+        x = min(int(floor((lng + 180) * self.nr_shortcuts_per_lng)), self.nr_of_columns - 1)
+        y = min(int(floor((90 - lat) * self.nr_shortcuts_per_lat)), self.nr_of_rows - 1)
+        return x, y
 
     def shortcuts_of(self, lng=0.0, lat=0.0):
-        # convert coords into shortcut
-        x = int(floor((lng + 180)))
-        y = int(floor((90 - lat) * 2))
+        return self.polygons_of_shortcut(*self.shortcut_of(lng, lat))
 
+    def polygons_of_shortcut(self, x=0, y=0):
         # get the address of the first entry in this shortcut
-        # offset: 180 * number of shortcuts per lat degree * 2bytes = entries per column of x shortcuts
         # shortcuts are stored: (0,0) (0,1) (0,2)... (1,0)...
-        self.binary_file.seek(self.shortcuts_start + 720 * x + 2 * y)
+        shortcut_nr = self.nr_of_rows * x + y
+        if self.in_memory:
+            return self.shortcut_entries[self.shortcut_offsets[shortcut_nr]:self.shortcut_offsets[shortcut_nr + 1]]
 
-        nr_of_polygons = unpack(b'!H', self.binary_file.read(2))[0]
+        nr_of_polygons = int(self.shortcut_counts[shortcut_nr])
 
-        self.binary_file.seek(self.first_shortcut_address + 1440 * x + 4 * y)
-        self.binary_file.seek(unpack(b'!I', self.binary_file.read(4))[0])
-        return fromfile(self.binary_file, dtype='>u2', count=nr_of_polygons)
+        if nr_of_polygons == 0:
+            # the address of empty shortcuts is 0
+            return empty(0, dtype='>u2')
 
-    def polygons_of_shortcut(self, x=0, y=0):
-        # get the address of the first entry in this shortcut
-        # offset: 180 * number of shortcuts per lat degree * 2bytes = entries per column of x shortcuts
-        # shortcuts are stored: (0,0) (0,1) (0,2)... (1,0)...
-        self.binary_file.seek(self.shortcuts_start + 720 * x + 2 * y)
+        return self._array_at(self._unpack_at(b'!I', self.first_shortcut_address + 4 * shortcut_nr), '>u2',
+                              nr_of_polygons)
 
-        nr_of_polygons = unpack(b'!H', self.binary_file.read(2))[0]
+    def unique_id_of_shortcut(self, x=0, y=0):
+        # the zone id of all polygons in this shortcut, NO_UNIQUE_ID if there are none or more than one zone
+        return int(self.unique_ids[self.nr_of_rows * x + y])
 
-        self.binary_file.seek(self.first_shortcut_address + 1440 * x + 4 * y)
-        self.binary_file.seek(unpack(b'!I', self.binary_file.read(4))[0])
-        return fromfile(self.binary_file, dtype='>u2', count=nr_of_polygons)
+    def boundaries_of(self, line=0):
+        # get the boundaries of the polygon = (lng_max, lng_min, lat_max, lat_min)
+        return self.boundaries[line]
+
+    def within_boundaries(self, polygon_nrs, x, y):
+        """
+        :param polygon_nrs: array of polygon numbers
+        :param x: longitude of the point as int32 (s. coord2int)
+        :param y: latitude of the point as int32
+        :return: the indices (in polygon_nrs) of the polygons whose boundaries include the point
+        """
+        boundaries = self.boundaries[asarray(polygon_nrs, dtype='i8')]
+        return nonzero((x <= boundaries[:, 0]) & (x >= boundaries[:, 1]) &
+                       (y <= boundaries[:, 2]) & (y >= boundaries[:, 3]))[0]
 
     def coords_of(self, line=0):
-        self.binary_file.seek((self.nr_val_start_address + 2 * line))
-        nr_of_values = unpack(b'!H', self.binary_file.read(2))[0]
+        if self.polygon_cache is None:
+            return self._coords_of(line)
+
+        coords = self.polygon_cache.get(line)
+        if coords is None:
+            coords = self._coords_of(line)
+            self.polygon_cache.put(line, coords)
+        return coords
+
+    def vectors_of(self, line=0):
+        """
+        :return: the unit vectors of all the points of the polygon as float64 array [[x...], [y...], [z...]]
+        """
+        if self.vector_cache is None:
+            return self._vectors_of(line)
+
+        vectors = self.vector_cache.get(line)
+        if vectors is None:
+            vectors = self._vectors_of(line)
+            self.vector_cache.put(line, vectors)
+        return vectors
+
+    def _vectors_of(self, line):
+        # same conversion as in coords2cartesian(), but for all points at once
+        coords = self.coords_of(line)
+        lngs = radians(coords[0] / 10 ** 7)
+        lats = radians(coords[1] / 10 ** 7)
+        cos_lats = np_cos(lats)
+        return array([np_cos(lngs) * cos_lats, np_sin(lngs) * cos_lats, np_sin(lats)])
+
+    def polygon_cache_info(self):
+        """
+        :return: a dict with the statistics of the polygon cache (hits, misses, size in bytes...) or None
+        """
+        if self.polygon_cache is None:
+            return None
+        return self.polygon_cache.info()
 
-        self.binary_file.seek((self.adr_start_address + 4 * line))
-        self.binary_file.seek(unpack(b'!I', self.binary_file.read(4))[0])
+    def vector_cache_info(self):
+        """
+        :return: a dict with the statistics of the vector cache (hits, misses, size in bytes...) or None
+        """
+        if self.vector_cache is None:
+            return None
+        return self.vector_cache.info()
+
+    def result_cache_info(self):
+        """
+        :return: a dict with the statistics of the result cache (hits, misses, hit rate...) or None
+        """
+        if self.result_cache is None:
+            return None
+        return self.result_cache.info()
+
+    def stats(self):
+        """
+        only with collect_stats=True. the lookups of the worker processes (processes=N) are not being counted.
+        :return: a dict with the number of lookups per function ('queries'), the totals of the counters
+            (shortcut candidates, unique zone hits, bbox rejects, inside polygon calls, vertices scanned,
+            distance to polygon calls, bytes read) and the histograms of the values per single point lookup
+            (pairs of the upper bound of the bucket and the number of lookups) or None
+        """
+        if self.stats_collector is None:
+            return None
+        return self.stats_collector.info()
+
+    def reset_stats(self):
+        if self.stats_collector is not None:
+            self.stats_collector.reset()
 
-        # return array([fromfile(self.binary_file, dtype='>i8', count=nr_of_values),
-        #               fromfile(self.binary_file, dtype='>i8', count=nr_of_values)])
+    def slow_queries(self):
+        """
+        :return: a list of the logged slow queries (the oldest first). every query is a dict with
+            the 'function' name, the point ('lng', 'lat'), the 'duration' in seconds, the 'result'
+            and the candidate 'polygons' as (polygon number, number of vertices) pairs: the polygons of the shortcut
+            of the point or (for closest_timezone_at() and closest_timezones()) the polygons whose distance was computed
+        """
+        return list(self.slow_query_log)
+
+    def clear_slow_queries(self):
+        self.slow_query_log.clear()
+
+    def _check_duration(self, function_name, lng, lat, start, result, polygon_nrs=None):
+        # (only with a slow_query_threshold) logs the query if it took too long
+        duration = default_timer() - start
+        if duration < self.slow_query_threshold:
+            return
+
+        if polygon_nrs is None:
+            polygon_nrs = self.shortcuts_of(lng, lat)
+        polygon_nrs = asarray(polygon_nrs, dtype='i8')
+        query = {
+            'function': function_name,
+            'lng': lng,
+            'lat': lat,
+            'duration': duration,
+            'result': result,
+            'polygons': list(zip(polygon_nrs.tolist(), self.nr_of_values[polygon_nrs].tolist())),
+        }
+        self.slow_query_log.append(query)
+        if self.slow_query_callback is not None:
+            self.slow_query_callback(query)
+
+    def _record_point_lookup(self, function_name, x, y, polygon_nrs, i):
+        """
+        (only with collect_stats) records the work of a point in polygon lookup
+        the polygons whose boundaries include the point are being tested in their order until the first match
+        :param i: the index (in polygon_nrs) of the polygon including the point (x,y) or -1
+        """
+        within = self.within_boundaries(polygon_nrs, x, y)
+        tested = within if i == -1 else within[within <= i]
+        self.stats_collector.record_query(
+            function_name, shortcut_candidates=len(polygon_nrs), bbox_rejects=len(polygon_nrs) - len(within),
+            inside_polygon_calls=len(tested),
+            vertices_scanned=self.nr_of_values[asarray(polygon_nrs, dtype='i8')[tested]].sum())
+
+    def _cached_lookup(self, function, lng, lat):
+        # the coordinates have to be checked before building the key (int() fails for inf and NaN)
+        if not (-180.0 <= lng <= 180.0 and -90.0 <= lat <= 90.0):
+            raise ValueError('The coordinates are out ouf bounds: (', lng, ',', lat, ')')
 
-        return array([fromfile(self.binary_file, dtype='>i4', count=nr_of_values),
-                      fromfile(self.binary_file, dtype='>i4', count=nr_of_values)])
+        # the results of the different lookup functions are being distinguished by the name of the function
+        # truncating the coordinates: same conversion as in coord2int()
+        key = (function.__name__, int(lng * self.result_cache_factor), int(lat * self.result_cache_factor))
+        result = self.result_cache.get(key, NOT_CACHED)
+        if result is NOT_CACHED:
+            result = function(lng, lat)
+            self.result_cache.put(key, result)
+        return result
+
+    def _coords_of(self, line):
+        if self.in_memory:
+            # no copy is being made, the array is a view of the coordinate pool
+            offset = self.polygon_offsets[line]
+            nr_of_values = self.nr_of_values[line]
+            return self.coordinates[offset:offset + 2 * nr_of_values].reshape(2, nr_of_values)
+
+        nr_of_values = self._unpack_at(b'!H', self.nr_val_start_address + 2 * line)
+        address = self._unpack_at(b'!I', self.adr_start_address + 4 * line)
+
+        # the x coordinates are stored first and then the y coordinates
+        # array() converts them into a native int32 array (as needed by numba)
+        return array([self._array_at(address, '>i4', nr_of_values),
+                      self._array_at(address + 4 * nr_of_values, '>i4', nr_of_values)])
 
     # @profile
+    def distance_to_shortcut(self, lng, lat, x, y):
+        """
+        :return: the shortest distance between the point and the area of the shortcut (x,y) in radians.
+            this is a lower bound for the distance to all the polygons in this shortcut
+        """
+        return distance_to_rectangle(lng, lat,
+                                     (x + 1) / self.nr_shortcuts_per_lng - 180, x / self.nr_shortcuts_per_lng - 180,
+                                     90 - y / self.nr_shortcuts_per_lat, 90 - (y + 1) / self.nr_shortcuts_per_lat)
+
     def closest_timezone_at(self, lng, lat, delta_degree=1):
         """
         This function searches for the closest polygon in the surrounding shortcuts.
         Make sure that the point does not lie within a polygon (for that case the algorithm is simply wrong!)
-        Note that the algorithm won't find the closest polygon when it's on the 'other end of earth'
-        (it can't search beyond the 180 deg lng border yet)
-        this checks all the polygons within [delta_degree] degree lng and lat
+        The shortcuts are being searched in the order of their distance to the point (best first),
+        starting with the shortcut of the point itself and also beyond the 180 deg lng border.
+        The polygons are being checked in the order of the distance to their boundaries and only if
+        their boundaries are closer than the closest polygon found so far.
+        The search stops as soon as no unchecked shortcut or polygon can be closer,
+        so only the polygons close to the point are being checked.
+        this checks the polygons within [delta_degree] degree lng and lat
         Keep in mind that x degrees lat are not the same distance apart than x degree lng!
         :param lng: longitude of the point in degree
         :param lat: latitude in degree
-        :param delta_degree: the 'search radius' in degree
+        :param delta_degree: the 'search radius' in degree. None means there is no limit:
+            then the result is the zone of the closest polygon on the whole earth (the exact nearest zone).
         :return: the timezone name of the closest found polygon or None
         """
 
         if lng > 180.0 or lng < -180.0 or lat > 90.0 or lat < -90.0:
             raise ValueError('The coordinates are out ouf bounds: (', lng, ',', lat, ')')
 
+        if delta_degree is None:
+            max_delta_x = self.nr_of_columns
+            max_delta_y = self.nr_of_rows
+        else:
+            # e.g. with 2 shortcuts per 1 degree lat two shortcuts (rows) have to be checked to cover 1 degree
+            max_delta_x = self.nr_shortcuts_per_lng * delta_degree
+            max_delta_y = self.nr_shortcuts_per_lat * delta_degree
+
+        checked_polygons = None
+        if self.slow_query_threshold is not None:
+            start = default_timer()
+            checked_polygons = []
+
         # the maximum possible distance is pi = 3.14...
-        min_distance = 4
-        # transform point X into cartesian coordinates
-        current_closest_id = None
-        central_x_shortcut = int(floor((lng + 180)))
-        central_y_shortcut = int(floor((90 - lat) * 2))
-
-        polygon_nrs = []
-
-        # there are 2 shortcuts per 1 degree lat, so to cover 1 degree two shortcuts (rows) have to be checked
-        # the highest shortcut is 0
-        top = max(central_y_shortcut - 2 * delta_degree, 0)
-        # the lowest shortcut is 360 (= 2 shortcuts per 1 degree lat)
-        bottom = min(central_y_shortcut + 2 * delta_degree, 360)
-
-        # the most left shortcut is 0
-        left = max(central_x_shortcut - delta_degree, 0)
-        # the most right shortcut is 360 (= 1 shortcuts per 1 degree lng)
-        right = min(central_x_shortcut + delta_degree, 360)
-
-        # select all the polygons from the surrounding shortcuts
-        for x in range(left, right + 1, 1):
-            for y in range(top, bottom + 1, 1):
-                for p in self.polygons_of_shortcut(x, y):
-                    if p not in polygon_nrs:
-                        polygon_nrs.append(p)
-
-        polygons_in_list = len(polygon_nrs)
-
-        if polygons_in_list == 0:
-            return None
+        closest_zones = self._closest_zones('closest_timezone_at', lng, lat, 1, 4, max_delta_x, max_delta_y,
+                                            checked_polygons)
+        result = None
+        if closest_zones:
+            result = timezone_names[closest_zones[0][1]]
 
-        # initialize the list of ids
-        ids = [self.id_of(x) for x in polygon_nrs]
+        if self.slow_query_threshold is not None:
+            self._check_duration('closest_timezone_at', lng, lat, start, result, checked_polygons)
+        return result
 
-        # if all the polygons in this shortcut belong to the same zone return it
-        first_entry = ids[0]
-        if ids.count(first_entry) == polygons_in_list:
-            return timezone_names[first_entry]
+    def closest_timezones(self, lng, lat, k=3, max_distance_km=None):
+        """
+        finds the k closest distinct timezones (e.g. for points on the sea).
+        The search works like the one of closest_timezone_at(delta_degree=None),
+        but it stops as soon as no unchecked shortcut or polygon can be closer than the k-th closest zone
+        or than max_distance_km. So the smaller the maximum distance, the less shortcuts are being checked.
+        Make sure that the point does not lie within a polygon (for that case the distance is not 0!)
+        :param lng: longitude of the point in degree
+        :param lat: latitude in degree
+        :param k: the maximum amount of zones to return
+        :param max_distance_km: only zones closer than this are being returned. None means there is no limit.
+        :return: a list of (timezone name, distance in km) ordered by the distance. empty if nothing was found.
+        """
 
-        # stores which polygons have been checked yet
-        already_checked = [False for i in range(polygons_in_list)]
+        if lng > 180.0 or lng < -180.0 or lat > 90.0 or lat < -90.0:
+            raise ValueError('The coordinates are out ouf bounds: (', lng, ',', lat, ')')
 
-        pointer = 0
-        polygons_checked = 0
+        if k < 1:
+            raise ValueError('k must be at least 1, but is', k)
 
-        while polygons_checked < polygons_in_list:
+        if max_distance_km is None:
+            max_distance = 4
+        else:
+            max_distance = max_distance_km / EARTH_RADIUS_KM
 
-            # only check a polygon when its id is not the closest a the moment!
-            if already_checked[pointer] or ids[pointer] == current_closest_id:
-                # go to the next polygon
-                polygons_checked += 1
+        checked_polygons = None
+        if self.slow_query_threshold is not None:
+            start = default_timer()
+            checked_polygons = []
 
-            else:
-                # this polygon has to be checked
-                coords = self.coords_of(polygon_nrs[pointer])
-                nr_points = len(coords[0])
-                empty_array = empty([2, nr_points], dtype='f8')
-                distance = distance_to_polygon(lng, lat, nr_points, coords, empty_array)
+        result = [(timezone_names[zone_id], distance * EARTH_RADIUS_KM) for distance, zone_id in
+                  self._closest_zones('closest_timezones', lng, lat, k, max_distance, self.nr_of_columns,
+                                      self.nr_of_rows, checked_polygons)]
 
-                already_checked[pointer] = True
-                if distance < min_distance:
-                    min_distance = distance
-                    current_closest_id = ids[pointer]
-                    # whole list has to be searched again!
-                    polygons_checked = 1
-            pointer = (pointer + 1) % polygons_in_list
+        if self.slow_query_threshold is not None:
+            self._check_duration('closest_timezones', lng, lat, start, result, checked_polygons)
+        return result
 
-        # the the whole list has been searched
-        return timezone_names[current_closest_id]
+    def _closest_zones(self, function_name, lng, lat, k, max_distance, max_delta_x, max_delta_y,
+                       checked_polygons=None):
+        """
+        searches the shortcuts best first (ordered by their distance to the point),
+        starting with the shortcut of the point itself and also beyond the 180 deg lng border.
+        :param function_name: the name of the lookup function (for the stats)
+        :param k: the amount of distinct zones to search for
+        :param max_distance: only zones closer than this (in radians) are being searched for
+        :param max_delta_x: the maximum amount of columns a shortcut may be apart from the one of the point
+        :param max_delta_y: the maximum amount of rows a shortcut may be apart from the one of the point
+        :param checked_polygons: a list the numbers of all polygons whose distance is being computed are appended to
+        :return: a list of the (distance in radians, zone id) of the k closest zones, ordered by the distance
+        """
+        central_x_shortcut, central_y_shortcut = self.shortcut_of(lng, lat)
+        # the distances to the polygons are being computed with the unit vectors of the points
+        px, py, pz = coords2cartesian(lng, lat)
+
+        # the closest distance found so far for every zone
+        zone_distances = {}
+        # no shortcut or polygon which is further away than this can change the result
+        max_relevant_distance = max_distance
+
+        # the queue of shortcuts and polygons ordered by (a lower bound of) their distance to the point
+        # entries: (distance, SHORTCUT, x, y) or (distance, POLYGON, polygon_nr, 0)
+        queue = [(0.0, SHORTCUT, central_x_shortcut, central_y_shortcut)]
+        queued_shortcuts = {(central_x_shortcut, central_y_shortcut)}
+        queued_polygons = set()
+
+        # only counted with collect_stats
+        nr_of_rejects = 0
+        nr_of_distance_calls = 0
+        nr_of_vertices = 0
+
+        while queue:
+            lower_bound, entry_type, x, y = heappop(queue)
+            if lower_bound >= max_relevant_distance:
+                # none of the remaining shortcuts and polygons can change the result
+                break
+
+            if entry_type == POLYGON:
+                # the boundaries of this polygon are close enough to change the result
+                zone_id = self.id_of(x)
+                if zone_distances.get(zone_id, 4) <= lower_bound:
+                    # the zone of this polygon is already known to be closer
+                    continue
+
+                vectors = self.vectors_of(x)
+                distance = distance_to_polygon_vectors(px, py, pz, vectors)
+                if checked_polygons is not None:
+                    checked_polygons.append(x)
+                if self.stats_collector is not None:
+                    nr_of_distance_calls += 1
+                    nr_of_vertices += vectors.shape[1]
+                if distance < max_relevant_distance and distance < zone_distances.get(zone_id, 4):
+                    zone_distances[zone_id] = distance
+                    if len(zone_distances) >= k:
+                        # the distance of the k-th closest zone
+                        max_relevant_distance = sorted(zone_distances.values())[k - 1]
+                continue
+
+            for polygon_nr in self.polygons_of_shortcut(x, y):
+                if polygon_nr in queued_polygons:
+                    continue
+                queued_polygons.add(polygon_nr)
+
+                # the distance to the boundaries is a lower bound for the distance to the polygon
+                distance_to_boundaries = distance_to_rectangle(lng, lat, *(self.boundaries[polygon_nr] / 10 ** 7))
+                if distance_to_boundaries < max_relevant_distance:
+                    heappush(queue, (distance_to_boundaries, POLYGON, polygon_nr, 0))
+                elif self.stats_collector is not None:
+                    nr_of_rejects += 1
+
+            # add the neighbouring shortcuts to the queue
+            for delta_x in (-1, 0, 1):
+                # the columns wrap around at the 180 deg lng border
+                neighbour_x = (x + delta_x) % self.nr_of_columns
+                distance_x = abs(neighbour_x - central_x_shortcut)
+                if min(distance_x, self.nr_of_columns - distance_x) > max_delta_x:
+                    continue
+
+                for delta_y in (-1, 0, 1):
+                    neighbour_y = y + delta_y
+                    if neighbour_y < 0 or neighbour_y >= self.nr_of_rows or \
+                            abs(neighbour_y - central_y_shortcut) > max_delta_y:
+                        continue
+
+                    if (neighbour_x, neighbour_y) not in queued_shortcuts:
+                        queued_shortcuts.add((neighbour_x, neighbour_y))
+                        distance_to_shortcut = self.distance_to_shortcut(lng, lat, neighbour_x, neighbour_y)
+                        if distance_to_shortcut < max_relevant_distance:
+                            heappush(queue, (distance_to_shortcut, SHORTCUT, neighbour_x, neighbour_y))
+
+        if self.stats_collector is not None:
+            self.stats_collector.record_query(
+                function_name, shortcut_candidates=len(queued_polygons), bbox_rejects=nr_of_rejects,
+                distance_to_polygon_calls=nr_of_distance_calls, vertices_scanned=nr_of_vertices)
+
+        return sorted((distance, zone_id) for zone_id, distance in zone_distances.items())[:k]
 
     def timezone_at(self, lng=0.0, lat=0.0):
         """
@@ -213,46 +701,76 @@ class TimezoneFinder:
         :param lat: latitude in degree (90 to -90)
         :return: the timezone name of the matching polygon or None
         """
+        if self.slow_query_threshold is not None:
+            start = default_timer()
+
+        if self.result_cache is None:
+            result = self._timezone_at(lng, lat)
+        else:
+            result = self._cached_lookup(self._timezone_at, lng, lat)
+
+        if self.slow_query_threshold is not None:
+            # the candidates are the polygons of the shortcut of the point
+            self._check_duration('timezone_at', lng, lat, start, result)
+        return result
+
+    def _timezone_at(self, lng, lat):
         if lng > 180.0 or lng < -180.0 or lat > 90.0 or lat < -90.0:
             raise ValueError('The coordinates are out ouf bounds: (', lng, ',', lat, ')')
 
-        possible_polygons = self.shortcuts_of(lng, lat)
-
-        # x = longitude  y = latitude  both converted to 8byte int
-        x = coord2int(lng)
-        y = coord2int(lat)
+        shortcut_x, shortcut_y = self.shortcut_of(lng, lat)
 
+        # if all the polygons in this shortcut belong to the same zone return it
+        # (the polygons do not have to be read at all)
+        unique_id = self.unique_id_of_shortcut(shortcut_x, shortcut_y)
+        if unique_id != NO_UNIQUE_ID:
+            if self.stats_collector is not None:
+                self.stats_collector.record_query('timezone_at', unique_zone_hits=1)
+            return timezone_names[unique_id]
+
+        possible_polygons = self.polygons_of_shortcut(shortcut_x, shortcut_y)
         nr_possible_polygons = len(possible_polygons)
 
         if nr_possible_polygons == 0:
+            if self.stats_collector is not None:
+                self.stats_collector.record_query('timezone_at', shortcut_candidates=0)
             return None
 
-        if nr_possible_polygons == 1:
-            return timezone_names[self.id_of(possible_polygons[0])]
+        # x = longitude  y = latitude  both converted to 8byte int
+        x = coord2int(lng)
+        y = coord2int(lat)
+
+        if self.in_memory:
+            # the whole loop runs compiled (with numba)
+            i = self._inside_which_polygon(x, y, possible_polygons)
+            if self.stats_collector is not None:
+                self._record_point_lookup('timezone_at', x, y, possible_polygons, i)
+            if i == -1:
+                return None
+            return timezone_names[self.zone_ids[possible_polygons[i]]]
 
         # initialize the list of ids
-        ids = [self.id_of(p) for p in possible_polygons]
-
-        # if all the polygons belong to the same zone return it
-        first_entry = ids[0]
-        if ids.count(first_entry) == nr_possible_polygons:
-            return timezone_names[first_entry]
+        ids = self.ids_of(possible_polygons)
 
         # otherwise check if the point is included for all the possible polygons
-        for i in range(nr_possible_polygons):
-            polygon_nr = possible_polygons[i]
-
-            # get the boundaries of the polygon = (lng_max, lng_min, lat_max, lat_min)
-            # self.binary_file.seek((self.bound_start_address + 32 * polygon_nr), )
-            self.binary_file.seek((self.bound_start_address + 16 * polygon_nr), )
-            boundaries = fromfile(self.binary_file, dtype='>i4', count=4)
-            # only run the algorithm if it the point is withing the boundaries
-            if not (x > boundaries[0] or x < boundaries[1] or y > boundaries[2] or y < boundaries[3]):
-
-                if inside_polygon(x, y, self.coords_of(line=polygon_nr)):
-                    return timezone_names[ids[i]]
+        # only run the algorithm for the polygons whose boundaries include the point
+        for i in self.within_boundaries(possible_polygons, x, y):
+            if inside_polygon(x, y, self.coords_of(line=possible_polygons[i])):
+                if self.stats_collector is not None:
+                    self._record_point_lookup('timezone_at', x, y, possible_polygons, i)
+                return timezone_names[ids[i]]
+        if self.stats_collector is not None:
+            self._record_point_lookup('timezone_at', x, y, possible_polygons, -1)
         return None
 
+    def _inside_which_polygon(self, x, y, polygon_nrs):
+        """
+        only for the in memory mode
+        :return: the index (in polygon_nrs) of the first polygon including the point (x,y) or -1
+        """
+        return inside_which_polygon(x, y, asarray(polygon_nrs, dtype='i8'), self.boundaries, self.nr_of_values,
+                                    self.polygon_offsets, self.coordinates)
+
     def certain_timezone_at(self, lng=0.0, lat=0.0):
         """
         this function looks up in which polygon the point certainly is included
@@ -261,7 +779,20 @@ class TimezoneFinder:
         :param lat: latitude in degree
         :return: the timezone name of the polygon the point is included in or None
         """
+        if self.slow_query_threshold is not None:
+            start = default_timer()
+
+        if self.result_cache is None:
+            result = self._certain_timezone_at(lng, lat)
+        else:
+            result = self._cached_lookup(self._certain_timezone_at, lng, lat)
 
+        if self.slow_query_threshold is not None:
+            # the candidates are the polygons of the shortcut of the point
+            self._check_duration('certain_timezone_at', lng, lat, start, result)
+        return result
+
+    def _certain_timezone_at(self, lng, lat):
         if lng > 180.0 or lng < -180.0 or lat > 90.0 or lat < -90.0:
             raise ValueError('The coordinates are out ouf bounds: (', lng, ',', lat, ')')
 
@@ -271,13 +802,263 @@ class TimezoneFinder:
         x = coord2int(lng)
         y = coord2int(lat)
 
-        for polygon_nr in possible_polygons:
-            # get boundaries
-            self.binary_file.seek((self.bound_start_address + 16 * polygon_nr), )
-            boundaries = fromfile(self.binary_file, dtype='>i4', count=4)
-            if not (x > boundaries[0] or x < boundaries[1] or y > boundaries[2] or y < boundaries[3]):
-                if inside_polygon(x, y, self.coords_of(line=polygon_nr)):
-                    if self.id_of(polygon_nr) >= 424:
-                        raise ValueError(self.id_of(polygon_nr))
-                    return timezone_names[self.id_of(polygon_nr)]
+        if self.in_memory:
+            # the whole loop runs compiled (with numba)
+            i = self._inside_which_polygon(x, y, possible_polygons)
+            if self.stats_collector is not None:
+                self._record_point_lookup('certain_timezone_at', x, y, possible_polygons, i)
+            if i == -1:
+                return None
+            return timezone_names[self.zone_ids[possible_polygons[i]]]
+
+        # only run the algorithm for the polygons whose boundaries include the point
+        for i in self.within_boundaries(possible_polygons, x, y):
+            polygon_nr = possible_polygons[i]
+            if inside_polygon(x, y, self.coords_of(line=polygon_nr)):
+                if self.stats_collector is not None:
+                    self._record_point_lookup('certain_timezone_at', x, y, possible_polygons, i)
+                if self.id_of(polygon_nr) >= 424:
+                    raise ValueError(self.id_of(polygon_nr))
+                return timezone_names[self.id_of(polygon_nr)]
+        if self.stats_collector is not None:
+            self._record_point_lookup('certain_timezone_at', x, y, possible_polygons, -1)
         return None
+
+    def _zone_ids_many(self, lngs, lats, certain):
+        lngs = asarray(lngs, dtype='f8')
+        lats = asarray(lats, dtype='f8')
+        if lngs.shape != lats.shape or lngs.ndim != 1:
+            raise ValueError('lngs and lats have to be 1-dimensional arrays of the same length')
+
+        # every comparison with NaN is False: only checking for invalid values would let NaN pass
+        if not np_all((lngs <= 180.0) & (lngs >= -180.0) & (lats <= 90.0) & (lats >= -90.0)):
+            raise ValueError('Some of the coordinates are out ouf bounds')
+
+        function_name = 'certain_timezone_at_many' if certain else 'timezone_at_many'
+        if self.in_memory and zone_ids_of_points is not None:
+            # the whole batch is being processed in parallel by one compiled function
+            # (only the number of points can be counted)
+            if self.stats_collector is not None:
+                self.stats_collector.record_batch(function_name, len(lngs))
+            with PARALLEL_LOCK:
+                return zone_ids_of_points(lngs, lats, certain, self.nr_shortcuts_per_lng, self.nr_shortcuts_per_lat,
+                                          self.unique_ids, self.shortcut_offsets, self.shortcut_entries,
+                                          self.zone_ids, self.boundaries, self.nr_of_values, self.polygon_offsets,
+                                          self.coordinates)
+
+        # -1 means no zone has been found (yet)
+        zone_ids = full(len(lngs), -1, dtype='i4')
+
+        # all the points are being processed shortcut by shortcut (same conversion as in shortcut_of())
+        shortcut_xs = minimum(np_floor((lngs + 180) * self.nr_shortcuts_per_lng), self.nr_of_columns - 1).astype('i4')
+        shortcut_ys = minimum(np_floor((90 - lats) * self.nr_shortcuts_per_lat), self.nr_of_rows - 1).astype('i4')
+        shortcut_nrs = self.nr_of_rows * shortcut_xs + shortcut_ys
+
+        # only counted with collect_stats
+        nr_of_candidates = 0
+        nr_of_unique_zone_hits = 0
+
+        # the points in shortcuts whose polygons all belong to the same zone are being resolved all at once
+        remaining = arange(len(lngs))
+        if not certain:
+            unique_ids = self.unique_ids[shortcut_nrs]
+            has_unique_id = unique_ids != NO_UNIQUE_ID
+            zone_ids[has_unique_id] = unique_ids[has_unique_id]
+            remaining = nonzero(~has_unique_id)[0]
+            nr_of_unique_zone_hits = len(lngs) - len(remaining)
+
+        # the points in shortcuts without polygons have no zone
+        remaining = remaining[self.shortcut_counts[shortcut_nrs[remaining]] != 0]
+
+        # the remaining points are being grouped by shortcut
+        order = remaining[argsort(shortcut_nrs[remaining], kind='mergesort')]
+        group_starts = unique(shortcut_nrs[order], return_index=True)[1]
+        group_ends = list(group_starts[1:]) + [len(order)]
+
+        # x = longitude  y = latitude  both converted to int32 (same conversion as in coord2int())
+        xs = (lngs * 10 ** 7).astype('i4')
+        ys = (lats * 10 ** 7).astype('i4')
+
+        # the candidate (point, polygon) pairs of all shortcuts
+        # rank: the position of the polygon in the shortcut (the first polygon including a point determines its zone)
+        pair_points = []
+        pair_polygons = []
+        pair_ranks = []
+        for start, end in zip(group_starts, group_ends):
+            point_nrs = order[start:end]
+            shortcut_x = shortcut_xs[point_nrs[0]]
+            shortcut_y = shortcut_ys[point_nrs[0]]
+            possible_polygons = self.polygons_of_shortcut(shortcut_x, shortcut_y).astype('i8')
+            nr_of_candidates += len(possible_polygons) * len(point_nrs)
+            if len(possible_polygons) == 0:
+                continue
+
+            # check the boundaries of all possible polygons against all the points at once
+            # only the points within the boundaries of a polygon have to be tested with the algorithm
+            boundaries = self.boundaries[possible_polygons]
+            x = xs[point_nrs]
+            y = ys[point_nrs]
+            ranks, candidates = nonzero((x <= boundaries[:, 0:1]) & (x >= boundaries[:, 1:2]) &
+                                        (y <= boundaries[:, 2:3]) & (y >= boundaries[:, 3:4]))
+            pair_points.append(point_nrs[candidates])
+            pair_polygons.append(possible_polygons[ranks])
+            pair_ranks.append(ranks)
+
+        if len(pair_points) != 0:
+            pair_points = concatenate(pair_points)
+            pair_polygons = concatenate(pair_polygons)
+            pair_ranks = concatenate(pair_ranks)
+
+        if self.stats_collector is not None:
+            # every candidate pair is being tested (not only until the first match)
+            nr_of_pairs = len(pair_points)
+            self.stats_collector.record_batch(
+                function_name, len(lngs), shortcut_candidates=nr_of_candidates,
+                unique_zone_hits=nr_of_unique_zone_hits, bbox_rejects=nr_of_candidates - nr_of_pairs,
+                inside_polygon_calls=nr_of_pairs,
+                vertices_scanned=self.nr_of_values[pair_polygons].sum() if nr_of_pairs else 0)
+
+        if len(pair_points) == 0:
+            return zone_ids
+
+        # every polygon is being read only once per batch and tested against all of its candidate points at once
+        matched = zeros(len(pair_points), dtype=bool)
+        order = argsort(pair_polygons, kind='mergesort')
+        polygon_nrs, group_starts = unique(pair_polygons[order], return_index=True)
+        group_ends = list(group_starts[1:]) + [len(order)]
+        for polygon_nr, start, end in zip(polygon_nrs, group_starts, group_ends):
+            pairs = order[start:end]
+            point_nrs = pair_points[pairs]
+            matched[pairs] = inside_polygon_many(xs[point_nrs], ys[point_nrs], self.coords_of(line=polygon_nr))
+
+        # the first matching polygon of the shortcut of each point (ordered by point and rank)
+        pairs = nonzero(matched)[0]
+        pairs = pairs[lexsort((pair_ranks[pairs], pair_points[pairs]))]
+        pairs = pairs[unique(pair_points[pairs], return_index=True)[1]]
+        zone_ids[pair_points[pairs]] = self.zone_ids[pair_polygons[pairs]]
+
+        return zone_ids
+
+    def _zone_ids_parallel(self, lngs, lats, certain, workers, processes):
+        if len(lngs) < 2 or (self.in_memory and zone_ids_of_points is not None):
+            # the compiled lookup of the in memory mode already uses all cores
+            return self._zone_ids_many(lngs, lats, certain)
+
+        if processes > 1:
+            # every process processes one consecutive chunk of the points
+            # all the processes map the .bin, so they share its pages (instead of loading the data into memory)
+            chunks = self._chunks_of(lngs, lats, certain, processes)
+            parameters = dict(self.parameters, use_mmap=True, in_memory=False)
+            pool = process_pool(len(chunks), initializer=_init_process, initargs=(parameters,))
+            try:
+                results = pool.map(_zone_ids_of_chunk, chunks)
+            finally:
+                pool.close()
+                pool.join()
+            return concatenate(results)
+
+        if workers <= 1:
+            return self._zone_ids_many(lngs, lats, certain)
+
+        # every thread processes one consecutive chunk of the points
+        # the numba kernels release the GIL, so the threads really run in parallel
+        pool = ThreadPool(workers)
+        try:
+            results = pool.map(lambda chunk: self._zone_ids_many(*chunk),
+                               self._chunks_of(lngs, lats, certain, workers))
+        finally:
+            # wait for the threads to exit, so they don't pile up when this is being called repeatedly
+            pool.close()
+            pool.join()
+        return concatenate(results)
+
+    @staticmethod
+    def _chunks_of(lngs, lats, certain, nr_of_chunks):
+        lngs = asarray(lngs, dtype='f8')
+        lats = asarray(lats, dtype='f8')
+        chunk_size = -(-len(lngs) // nr_of_chunks)
+        return [(lngs[start:start + chunk_size], lats[start:start + chunk_size], certain)
+                for start in range(0, len(lngs), chunk_size)]
+
+    def timezone_at_many(self, lngs, lats, return_ids=False, workers=1, processes=1):
+        """
+        vectorized version of 'timezone_at' for looking up a lot of points at once
+        the points are grouped by shortcut, so the data of every shortcut and polygon is only read once
+        and only the points within the boundaries of a polygon are being checked with the point in polygon algorithm
+        :param lngs: array of longitudes in degree (-180 to 180)
+        :param lats: array of latitudes in degree (90 to -90)
+        :param return_ids: return the zone ids (-1 when there is no result) instead of the names
+        :param workers: the number of threads the points are being split across
+        :param processes: the number of processes the points are being split across (instead of threads).
+            the processes are being started for every call, so this only pays off for really big arrays
+        :return: an array with the timezone name (or None) for every point
+        """
+        zone_ids = self._zone_ids_parallel(lngs, lats, False, workers, processes)
+        if return_ids:
+            return zone_ids
+        return array(timezone_names + [None], dtype=object)[zone_ids]
+
+    def certain_timezone_at_many(self, lngs, lats, return_ids=False, workers=1, processes=1):
+        """
+        vectorized version of 'certain_timezone_at' for looking up a lot of points at once
+        :param lngs: array of longitudes in degree (-180 to 180)
+        :param lats: array of latitudes in degree (90 to -90)
+        :param return_ids: return the zone ids (-1 when there is no result) instead of the names
+        :param workers: the number of threads the points are being split across
+        :param processes: the number of processes the points are being split across (instead of threads)
+        :return: an array with the timezone name (or None) for every point
+        """
+        zone_ids = self._zone_ids_parallel(lngs, lats, True, workers, processes)
+        if return_ids:
+            return zone_ids
+        return array(timezone_names + [None], dtype=object)[zone_ids]
+
+    def timezone_at_iter(self, points, chunk_size=10000, **kwargs):
+        """
+        streaming version of 'timezone_at_many': the points are being pulled from the iterable
+        and looked up in chunks, so the memory usage stays bounded no matter how many points there are
+        :param points: an iterable of (lng, lat) pairs (e.g. a generator)
+        :param chunk_size: the number of points being looked up at once
+        :param kwargs: are being passed on to timezone_at_many() (e.g. return_ids, workers)
+        :return: a generator of the timezone names (or None) in the order of the points
+        """
+        return self._iter_chunks(self.timezone_at_many, points, chunk_size, kwargs)
+
+    def certain_timezone_at_iter(self, points, chunk_size=10000, **kwargs):
+        """
+        streaming version of 'certain_timezone_at_many' (s. timezone_at_iter())
+        :return: a generator of the timezone names (or None) in the order of the points
+        """
+        return self._iter_chunks(self.certain_timezone_at_many, points, chunk_size, kwargs)
+
+    @staticmethod
+    def _iter_chunks(function, points, chunk_size, kwargs):
+        # validated here and not in the generator, which would only raise at the first next()
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1, but is', chunk_size)
+
+        def results():
+            point_iterator = iter(points)
+            while True:
+                chunk = list(islice(point_iterator, chunk_size))
+                if len(chunk) == 0:
+                    return
+                chunk = asarray(chunk, dtype='f8').reshape(len(chunk), 2)
+                for result in function(chunk[:, 0], chunk[:, 1], **kwargs):
+                    yield result
+
+        return results()
+
+
+# the instance used by the worker processes of the batch lookups (one per process)
+_process_timezone_finder = None
+
+
+def _init_process(parameters):
+    # every process creates its instance only once
+    global _process_timezone_finder
+    _process_timezone_finder = TimezoneFinder(**parameters)
+
+
+def _zone_ids_of_chunk(chunk):
+    return _process_timezone_finder._zone_ids_many(*chunk)